@@ -1,13 +1,37 @@
 #! /usr/bin/env python3.4
 
 import os
-import imageio
+import mmap
+import math
+import multiprocessing
+import tempfile
+import time
 import numpy as np
-from PIL import Image, ImageDraw
-from scipy import interpolate, spatial
+from concurrent import futures
+from scipy import spatial
+from MorphingCache import *
+from MorphingProfile import *
+from MorphingSinks import *
+from MorphingTiles import *
+
+class CoordinateBuffer:
+    def __init__(self, capacity = 0):
+        # Validate capacity input.
+        if capacity < 0:
+            raise ValueError("capacity must be non-negative.")
+
+        # Initialize homogeneous coordinate storage.
+        self.data = np.empty((capacity, 3), dtype = 'float64')
+
+    def take(self, count):
+        # Grow storage geometrically when a larger block is requested.
+        if count > self.data.shape[0]:
+            self.data = np.empty((max(count, 2 * self.data.shape[0]), 3), dtype = 'float64')
+
+        return self.data[:count]
 
 class Affine:
-    def __init__(self, source, destination):
+    def __init__(self, source, destination, profiler = None):
         # Validate source input.
         if source.dtype != 'float64':
             raise ValueError("source must be a numpy array of type float64.")
@@ -20,6 +44,12 @@ class Affine:
         if destination.shape != (3, 2):
             raise ValueError("destination must be a 3x2 array.")
 
+        # Validate profiler input.
+        if profiler is None:
+            profiler = nullProfiler
+        elif not isinstance(profiler, (Profiler, NullProfiler)):
+            raise TypeError("profiler must be a Profiler.")
+
         # Define combined source data matrix.
         A = np.array([[source[0, 0], source[0, 1], 1, 0, 0, 0],
                       [0, 0, 0, source[0, 0], source[0, 1], 1],
@@ -32,7 +62,8 @@ class Affine:
         b = np.reshape(destination, (6, 1))
 
         # Solve for transformation matrix.
-        h = np.linalg.solve(A, b)
+        with profiler.stage('affine.solve'):
+            h = np.linalg.solve(A, b)
 
         # Define combined transformation matrix data.
         matrix = np.vstack([np.reshape(h, (2, 3)), [0, 0, 1]])
@@ -41,232 +72,525 @@ class Affine:
         self.source = source
         self.destination = destination
         self.matrix = matrix
+        self.profiler = profiler
 
-    def transform(self, sourceImage, destinationImage):
+    def transform(self, sourceImage, destinationImage, coordinates = None, useLambda = False, boundary = None):
         # Validate sourceImage input.
-        if not isinstance(sourceImage, np.ndarray):
-            raise TypeError("sourceImage must be a numpy array.")
+        if not isImage(sourceImage):
+            raise TypeError("sourceImage must be a numpy array or TiledImage.")
 
         # Validate destinationImage input.
         if not isinstance(destinationImage, np.ndarray):
             raise TypeError("destinationImage must be a numpy array.")
 
-        # Define vectorizations.
-        hInv = np.linalg.inv(self.matrix)
-        getCoord = np.vectorize(lambda x, y, a: hInv[a, 0] * y + hInv[a, 1] * x + hInv[a, 2], otypes = [np.float64])
+        # Validate coordinates input.
+        if coordinates is None:
+            coordinates = CoordinateBuffer()
+        elif not isinstance(coordinates, CoordinateBuffer):
+            raise TypeError("coordinates must be a CoordinateBuffer.")
+
+        # Define inverse transformation.
+        with self.profiler.stage('affine.invert'):
+            hInv = np.linalg.inv(self.matrix)
+
+        # Define sampling range, matching a linear spline over the source bounding box.
+        lower = np.amin(self.source, axis = 0)
+        upper = lower + np.ceil(np.amax(self.source, axis = 0) - lower) - 1
+        offset = lower - np.floor(lower)
+
+        # Find covered pixels within the destination bounding box.
+        with self.profiler.stage('affine.rasterize') as stage:
+            _, xp, yp = rasterizeTriangles(self.destination[np.newaxis], destinationImage.shape, None if boundary is None else np.reshape(boundary, (1, 3)))
+            stage.pixels = xp.size
+
+        # Find transformed coordinates.
+        with self.profiler.stage('affine.map', xp.size):
+            if useLambda:
+                getCoord = np.vectorize(lambda x, y, a: hInv[a, 0] * y + hInv[a, 1] * x + hInv[a, 2], otypes = [np.float64])
+                x = getCoord(xp, yp, 1)
+                y = getCoord(xp, yp, 0)
+            else:
+                block = coordinates.take(xp.size)
+                block[:, 0] = yp
+                block[:, 1] = xp
+                block[:, 2] = 1
+                np.matmul(block, hInv.T, out = block)
+                x = block[:, 1]
+                y = block[:, 0]
+
+            # Clamp coordinates to the sampling range.
+            x = np.clip(x, lower[1], upper[1]) - offset[1]
+            y = np.clip(y, lower[0], upper[0]) - offset[0]
+
+        # Find transformed values for all channels at once.
+        with self.profiler.stage('affine.sample', xp.size):
+            destinationImage[xp, yp] = bilinearSample(sourceImage, x, y, destinationImage.dtype)
+
+def bilinearSample(image, rows, cols, dtype = 'float64'):
+    # Define neighbouring pixel indices.
+    rowFloor = np.floor(rows)
+    colFloor = np.floor(cols)
+    rows0 = np.clip(rowFloor.astype('intp'), 0, image.shape[0] - 1)
+    cols0 = np.clip(colFloor.astype('intp'), 0, image.shape[1] - 1)
+    rows1 = np.minimum(rows0 + 1, image.shape[0] - 1)
+    cols1 = np.minimum(cols0 + 1, image.shape[1] - 1)
+
+    # Define interpolation weights, shared by all channels.
+    rowWeights = (rows - rowFloor).astype(dtype, copy = False)
+    colWeights = (cols - colFloor).astype(dtype, copy = False)
+    if image.ndim == 3:
+        rowWeights = rowWeights[:, np.newaxis]
+        colWeights = colWeights[:, np.newaxis]
+
+    # Interpolate along columns, then along rows.
+    top = image[rows0, cols0] * (1 - colWeights) + image[rows0, cols1] * colWeights
+    bottom = image[rows1, cols0] * (1 - colWeights) + image[rows1, cols1] * colWeights
+
+    return top * (1 - rowWeights) + bottom * rowWeights
+
+def rasterizeTriangles(corners, shape, boundary = None, top = 0, bottom = None):
+    # Validate corners input.
+    corners = np.asarray(corners, dtype = 'float64')
+    if corners.ndim != 3 or corners.shape[1:] != (3, 2):
+        raise ValueError("corners must be a Tx3x2 array.")
+    count = corners.shape[0]
+    height, width = shape[:2]
+
+    # Validate boundary input; edge k joins vertices k and k + 1, and edges on the hull are closed.
+    if boundary is None:
+        boundary = np.ones((count, 3), dtype = bool)
+    elif np.shape(boundary) != (count, 3):
+        raise ValueError("boundary must be a Tx3 array.")
+
+    # Sort vertices top to bottom, then left to right, so shared edges are interpolated identically.
+    order = np.lexsort((corners[:, :, 0], corners[:, :, 1]), axis = -1)
+    x = np.take_along_axis(corners[:, :, 0], order, 1)
+    y = np.take_along_axis(corners[:, :, 1], order, 1)
+    x0, x1, x2 = x.T
+    y0, y1, y2 = y.T
+
+    # Find whether the long edge and both short edges lie on the hull.
+    def isClosed(a, b):
+        i, j = order[:, a], order[:, b]
+        return np.asarray(boundary, dtype = bool)[np.arange(count), np.where((i + 1) % 3 == j, i, j)]
+    longClosed, topClosed, bottomClosed = isClosed(0, 2), isClosed(0, 1), isClosed(1, 2)
+
+    # Define covered rows within [top, bottom), excluding a shared horizontal bottom edge and degenerate triangles.
+    first = np.maximum(np.ceil(y0), top)
+    last = np.minimum(np.where((y1 == y2) & ~bottomClosed, np.ceil(y2), np.floor(y2) + 1), height if bottom is None else bottom)
+    area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+    counts = np.where(area != 0, np.maximum(last - first, 0), 0).astype('intp')
+    triangles = np.repeat(np.arange(count), counts)
+    rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+
+    # Interpolate edges from their top endpoint, exactly at both ends.
+    def interpolate(xa, ya, xb, yb, at):
+        span = yb - ya
+        t = np.divide(at - ya, span, out = np.zeros(at.shape), where = span != 0)
+        return np.where(t == 1, xb, xa + t * (xb - xa))
+    upper = rows < y1[triangles]
+    longX = interpolate(x0[triangles], y0[triangles], x2[triangles], y2[triangles], rows)
+    shortX = np.where(upper, interpolate(x0[triangles], y0[triangles], x1[triangles], y1[triangles], rows), interpolate(x1[triangles], y1[triangles], x2[triangles], y2[triangles], rows))
+
+    # Fill from the left edge inclusive to the right edge exclusive, unless the right edge is on the hull.
+    shortRight = (area > 0)[triangles]
+    left = np.where(shortRight, longX, shortX)
+    right = np.where(shortRight, shortX, longX)
+    rightClosed = np.where(shortRight, np.where(upper, topClosed[triangles], bottomClosed[triangles]), longClosed[triangles])
+    start = np.maximum(np.ceil(left), 0).astype('intp')
+    stop = np.minimum(np.where(rightClosed, np.floor(right) + 1, np.ceil(right)), width).astype('intp')
+
+    # Expand row spans into pixel coordinates.
+    widths = np.maximum(stop - start, 0)
+    offsets = np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+
+    return np.repeat(triangles, widths), np.repeat(rows.astype('intp'), widths), np.repeat(start, widths) + offsets
+
+def invertTriangles(matrices):
+    # Define cofactors of each homogeneous triangle matrix.
+    a, b, c = matrices[:, 0, 0], matrices[:, 0, 1], matrices[:, 0, 2]
+    d, e, f = matrices[:, 1, 0], matrices[:, 1, 1], matrices[:, 1, 2]
+    g, h, i = matrices[:, 2, 0], matrices[:, 2, 1], matrices[:, 2, 2]
+    adjugate = np.empty(matrices.shape, dtype = 'float64')
+    adjugate[:, 0, 0] = e * i - f * h
+    adjugate[:, 0, 1] = c * h - b * i
+    adjugate[:, 0, 2] = b * f - c * e
+    adjugate[:, 1, 0] = f * g - d * i
+    adjugate[:, 1, 1] = a * i - c * g
+    adjugate[:, 1, 2] = c * d - a * f
+    adjugate[:, 2, 0] = d * h - e * g
+    adjugate[:, 2, 1] = b * g - a * h
+    adjugate[:, 2, 2] = a * e - b * d
+
+    # Scale by the determinants in closed form.
+    determinant = a * adjugate[:, 0, 0] + b * adjugate[:, 1, 0] + c * adjugate[:, 2, 0]
+
+    return adjugate / determinant[:, np.newaxis, np.newaxis]
+
+def sortSimplices(simplices):
+    # Order triangles canonically, so folded triangles overlap alike however the triangulation was built.
+    simplices = np.sort(simplices, axis = 1)
+
+    return simplices[np.lexsort(simplices.T[::-1])]
+
+class TriangleGeometry:
+    def __init__(self, points, simplices):
+        # Validate points input.
+        if not isinstance(points, np.ndarray):
+            raise TypeError("points must be a numpy array.")
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError("points must be an Nx2 array.")
+
+        # Validate simplices input.
+        if not isinstance(simplices, np.ndarray):
+            raise TypeError("simplices must be a numpy array.")
+        if simplices.ndim != 2 or simplices.shape[1] != 3:
+            raise ValueError("simplices must be a Tx3 array.")
+
+        # Define homogeneous point matrices, one column per triangle vertex.
+        corners = points[simplices].astype('float64')
+        matrices = np.ones((simplices.shape[0], 3, 3), dtype = 'float64')
+        matrices[:, :2, :] = np.transpose(corners, (0, 2, 1))
+
+        # Define sampling ranges matching the per-triangle spline grids.
+        lower = np.amin(corners, axis = 1)
+        upper = lower + np.ceil(np.amax(corners, axis = 1) - lower) - 1
+        offset = lower - np.floor(lower)
+
+        # Initialize geometry data.
+        self.points = points
+        self.simplices = simplices
+        self.corners = corners
+        self.matrices = matrices
+        self.lower = lower
+        self.upper = upper
+        self.offset = offset
+
+class WarpEngine:
+    def __init__(self, shape, simplices):
+        # Validate shape input.
+        if len(shape) < 2:
+            raise ValueError("shape must have at least two dimensions.")
+
+        # Validate simplices input.
+        if not isinstance(simplices, np.ndarray):
+            raise TypeError("simplices must be a numpy array.")
+        if simplices.ndim != 2 or simplices.shape[1] != 3:
+            raise ValueError("simplices must be a Tx3 array.")
+
+        # Find edges on the hull, used by exactly one triangle.
+        edges = np.sort(np.stack([simplices, np.roll(simplices, -1, axis = 1)], axis = 2), axis = 2).reshape(-1, 2)
+        _, inverse, counts = np.unique(edges, axis = 0, return_inverse = True, return_counts = True)
+
+        # Initialize warp engine data.
+        self.shape = tuple(shape[:2])
+        self.simplices = simplices
+        self.boundary = (counts[inverse.ravel()] == 1).reshape(-1, 3)
+
+    def rasterize(self, corners, rows = None):
+        # Scan every target triangle into a single index map, or the map of one band of rows; uncovered pixels are marked with -1.
+        start, stop = rows if rows is not None else (0, self.shape[0])
+        triangles, rows, cols = rasterizeTriangles(corners, self.shape, self.boundary, start, stop)
+        indexMap = np.full((stop - start, self.shape[1]), -1, dtype = 'int32')
+        indexMap[rows - start, cols] = triangles
+
+        return indexMap
+
+    def rasterizeStack(self, cornerStack):
+        # Scan the target triangles of several frames in one pass, into one index map per frame.
+        count = self.simplices.shape[0]
+        triangles, rows, cols = rasterizeTriangles(cornerStack.reshape(-1, 3, 2), self.shape, np.tile(self.boundary, (cornerStack.shape[0], 1)))
+        indexMaps = np.full((cornerStack.shape[0],) + self.shape, -1, dtype = 'int32')
+        indexMaps[triangles // count, rows, cols] = triangles % count
+
+        return indexMaps
+
+    def getTargetInverse(self, startGeometry, endGeometry, alpha):
+        # Interpolate target triangles and invert them in closed form.
+        return invertTriangles((1 - alpha) * startGeometry.matrices + alpha * endGeometry.matrices)
+
+    def getTargetInverses(self, startGeometry, endGeometry, alphas):
+        # Interpolate and invert the target triangles of several frames at once.
+        weights = np.asarray(alphas, dtype = 'float64')[:, np.newaxis, np.newaxis, np.newaxis]
+        matrices = (1 - weights) * startGeometry.matrices + weights * endGeometry.matrices
+
+        return invertTriangles(matrices.reshape(-1, 3, 3)).reshape(matrices.shape)
+
+    def getTiles(self, tiles):
+        # Split output rows into contiguous horizontal bands.
+        height = int(math.ceil(self.shape[0] / max(int(tiles), 1)))
+
+        return [(start, min(start + height, self.shape[0])) for start in range(0, self.shape[0], height)]
+
+    def forEachTile(self, render, threads = 1, tiles = None):
+        # Validate threads input.
+        if int(threads) < 1:
+            raise ValueError("threads must be a positive integer.")
+
+        # Render the whole frame at once, or each tile on a thread pool.
+        if threads == 1 and tiles is None:
+            render(0, self.shape[0])
+            return
+        bands = self.getTiles(tiles if tiles is not None else 4 * int(threads))
+        with futures.ThreadPoolExecutor(int(threads)) as executor:
+            for result in [executor.submit(render, start, stop) for start, stop in bands]:
+                result.result()
+
+    def warp(self, sourceImage, geometry, targetInverse, indexMap, destinationImage, rows = None, pixels = None, top = 0):
+        # Validate sourceImage input.
+        if not isImage(sourceImage):
+            raise TypeError("sourceImage must be a numpy array or TiledImage.")
 
-        # Generate spline.
-        xRange = np.arange(np.amin(self.source[:, 1]), np.amax(self.source[:, 1]), 1)
-        yRange = np.arange(np.amin(self.source[:, 0]), np.amax(self.source[:, 0]), 1)
-        zRange = sourceImage[int(xRange[0]):int(xRange[-1] + 1), int(yRange[0]):int(yRange[-1] + 1)]
-        spline = interpolate.RectBivariateSpline(xRange, yRange, zRange, kx = 1, ky = 1)
+        # Validate geometry input.
+        if not isinstance(geometry, TriangleGeometry):
+            raise TypeError("geometry must be a TriangleGeometry.")
 
-        # Generate transformation mask.
-        mask = Image.new('L', (destinationImage.shape[1], destinationImage.shape[0]), 0)
-        ImageDraw.Draw(mask).polygon(self.destination.ravel().tolist(), outline = 255, fill = 255)
-        xp, yp = np.nonzero(mask)
+        # Validate destinationImage input.
+        if not isinstance(destinationImage, np.ndarray):
+            raise TypeError("destinationImage must be a numpy array.")
 
-        # Find transformed coordinates and values.
-        x = getCoord(xp, yp, 1)
-        y = getCoord(xp, yp, 0)
-        destinationImage[xp, yp] = spline.ev(x, y)
+        # Restrict work to the requested band of rows, unless covered pixels are given; band-sized maps begin at frame row top.
+        start, stop = rows if rows is not None and pixels is None else (0, indexMap.shape[0])
+        indexMap = indexMap[start:stop]
+        destinationImage = destinationImage[start:stop]
+
+        # Find covered pixels and where they come from.
+        if pixels is None: pixels = np.flatnonzero(indexMap >= 0)
+        x, y = self.getSourceCoordinates(geometry, targetInverse, indexMap, pixels, top + start)
+
+        # Sample all covered pixels in one gather.
+        destinationImage.reshape((-1,) + destinationImage.shape[2:])[pixels] = bilinearSample(sourceImage, x, y, destinationImage.dtype)
+
+        return pixels.size
+
+    def getSourceCoordinates(self, geometry, targetInverse, indexMap, pixels, start = 0):
+        # Find triangles of covered pixels.
+        triangles = indexMap.ravel()[pixels]
+        rows, cols = np.divmod(pixels, self.shape[1])
+        rows += start
+
+        # Map covered pixels back to the source.
+        hInv = np.matmul(geometry.matrices, targetInverse)
+        x = hInv[triangles, 1, 0] * cols + hInv[triangles, 1, 1] * rows + hInv[triangles, 1, 2]
+        y = hInv[triangles, 0, 0] * cols + hInv[triangles, 0, 1] * rows + hInv[triangles, 0, 2]
+
+        # Clamp coordinates to each triangle's source bounding box.
+        x = np.clip(x, geometry.lower[triangles, 1], geometry.upper[triangles, 1]) - geometry.offset[triangles, 1]
+        y = np.clip(y, geometry.lower[triangles, 0], geometry.upper[triangles, 0]) - geometry.offset[triangles, 0]
+
+        return x, y
+
+    def warpStack(self, sourceImage, geometry, targetInverses, indexMaps, destinationImages):
+        # Find covered pixels of every frame and their triangles.
+        pixels = np.flatnonzero(indexMaps >= 0)
+        triangles = indexMaps.ravel()[pixels]
+        frames, rows = np.divmod(pixels, self.shape[0] * self.shape[1])
+        rows, cols = np.divmod(rows, self.shape[1])
+
+        # Map covered pixels back to the source through their frame's target triangle.
+        hInv = np.matmul(geometry.matrices, targetInverses)
+        x = hInv[frames, triangles, 1, 0] * cols + hInv[frames, triangles, 1, 1] * rows + hInv[frames, triangles, 1, 2]
+        y = hInv[frames, triangles, 0, 0] * cols + hInv[frames, triangles, 0, 1] * rows + hInv[frames, triangles, 0, 2]
+
+        # Clamp coordinates to each triangle's source bounding box.
+        x = np.clip(x, geometry.lower[triangles, 1], geometry.upper[triangles, 1]) - geometry.offset[triangles, 1]
+        y = np.clip(y, geometry.lower[triangles, 0], geometry.upper[triangles, 0]) - geometry.offset[triangles, 0]
+
+        # Sample all frames in one gather.
+        destinationImages.reshape((-1,) + destinationImages.shape[3:])[pixels] = bilinearSample(sourceImage, x, y, destinationImages.dtype)
+
+        return pixels.size
+
+class TemporaryArray:
+    # Stands in for a shared memory block, deleting its backing file once workers are done.
+    def __init__(self, path):
+        self.path = path
+
+    def close(self):
+        pass
+
+    def unlink(self):
+        os.remove(self.path)
+
+def shareArray(array):
+    # Pass file-backed images by reference so workers page them in themselves.
+    if isinstance(array, TiledImage):
+        return None, ('tiled', array.path)
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.flags.c_contiguous:
+        return None, ('memmap', array.filename, array.offset, array.shape, array.dtype.str)
+
+    # Copy array into a temporary file where shared memory is unavailable, before Python 3.8.
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        handle, path = tempfile.mkstemp(suffix = '.npy')
+        os.close(handle)
+        copy = np.lib.format.open_memmap(path, mode = 'w+', dtype = array.dtype, shape = array.shape)
+        copy[...] = array
+        copy.flush()
+        return TemporaryArray(path), ('memmap', path, copy.offset, array.shape, array.dtype.str)
+
+    # Copy array into a new shared memory block.
+    memory = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype = array.dtype, buffer = memory.buf)[...] = array
+
+    return memory, ('shared', memory.name, array.shape, array.dtype.str)
+
+def attachArray(spec):
+    # Reopen file-backed images.
+    if spec[0] == 'tiled':
+        return None, TiledImage(spec[1])
+    if spec[0] == 'memmap':
+        _, path, offset, shape, dtype = spec
+        return None, np.memmap(path, dtype = dtype, mode = 'r', offset = offset, shape = shape)
+
+    # Attach to a shared memory block owned by the parent process.
+    from multiprocessing import shared_memory
+    _, name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name = name)
+
+    return memory, np.ndarray(shape, dtype = dtype, buffer = memory.buf)
+
+workerState = {}
+
+def initializeWorker(blenderType, specs, pointSets, precision, cache, maps = None, traceMemory = None):
+    # Build one blender per worker on top of the shared images, profiled when the parent is.
+    attached = [attachArray(spec) for spec in specs]
+    workerState['memory'] = [memory for memory, _ in attached]
+    workerState['profiler'] = Profiler(traceMemory = traceMemory) if traceMemory is not None else None
+    workerState['blender'] = blenderType.fromImages([image for _, image in attached], pointSets, precision, cache, workerState['profiler'])
+
+    # Render through the parent's displacement fields, shared like the images.
+    if maps is not None:
+        alphas, spec = maps
+        memory, fields = attachArray(spec)
+        workerState['memory'].append(memory)
+        workerState['blender'].maps = DisplacementMaps(workerState['blender'], alphas, fields.dtype, fields = fields)
+
+def renderWorkerFrame(alpha):
+    # Return the frame with the stages recorded while rendering it.
+    frame = workerState['blender'].getBlendedImage(alpha)
+    profiler = workerState['profiler']
+    if profiler is None:
+        return frame, None
+    report = profiler.getReport()
+    profiler.reset()
+
+    return frame, report
+
+def renderFrames(blender, alphas, workers = 1):
+    # Validate workers input.
+    if int(workers) < 1:
+        raise ValueError("workers must be a positive integer.")
+
+    # Render sequentially in this process.
+    if workers == 1:
+        for alpha in alphas:
+            yield blender.getBlendedImage(alpha)
+        return
+
+    # Render on a process pool sharing every image and any displacement fields, yielding frames in order.
+    maps = getattr(blender, 'maps', None)
+    images = [shareArray(image) for image in blender.getImages()]
+    fields = [shareArray(maps.fields)] if maps is not None else []
+    shared = images + fields
+    try:
+        traceMemory = blender.profiler.traceMemory if isinstance(blender.profiler, Profiler) else None
+        arguments = (type(blender), [spec for _, spec in images], blender.getPointSets(), blender.precision, blender.cache, (maps.alphas, fields[0][1]) if fields else None, traceMemory)
+        with multiprocessing.Pool(int(workers), initializeWorker, arguments) as pool:
+            for frame, report in pool.imap(renderWorkerFrame, alphas):
+                # Merge worker stages into the parent's report; their seconds add up across processes.
+                for name, stage in (report or {}).items():
+                    blender.profiler.record(name, stage['seconds'], stage['pixels'], stage['peakBytes'], stage['calls'])
+                yield frame
+    finally:
+        for memory, _ in shared:
+            if memory is None: continue
+            memory.close()
+            memory.unlink()
+
+def streamFrames(frames, targetFolderPath, sequenceLength, includeReversed, shape, profiler, reverseMode = 'hardlink', sinks = None, queueSize = 8, onProgress = None):
+    # Create target folder path if it does not already exist.
+    if not os.path.exists(targetFolderPath): os.makedirs(targetFolderPath)
+
+    # Define outputs, defaulting to JPEG stills and an MP4.
+    if sinks is None: sinks = [ImageSequenceSink(mode = 'L' if len(shape) == 2 else 'RGB', reverseMode = reverseMode), VideoSink()]
+    pipeline = FramePipeline(sinks, queueSize, onProgress)
+    pipeline.open(targetFolderPath, sequenceLength, includeReversed)
+
+    # Stream frames to the encoder thread as they are rendered.
+    pixels = shape[0] * shape[1]
+    try:
+        start = time.perf_counter()
+        for i, frame in enumerate(frames):
+            profiler.record('render', time.perf_counter() - start, pixels)
+            pipeline.put(i, frame)
+            start = time.perf_counter()
+    finally:
+        frames.close()
+        pipeline.close()
+
+    # Record encoder time per sink, measured on the pipeline thread.
+    stats = pipeline.getStats()
+    profiler.record('queue', stats['blockedTime'], calls = stats['framesQueued'])
+    for name, seconds in stats['sinkTimes'].items():
+        profiler.record('encode.' + name, seconds, pixels * stats['framesWritten'], calls = stats['framesWritten'])
+
+    return stats
+
+# Working memory for batched rendering, and its estimated cost per pixel and frame beyond the warp buffers.
+batchBudget = 256 * 2 ** 20
+batchPixelBytes = 96
+
+# Working memory for one frame rendered band by band, and its estimated cost per pixel beyond the warp buffers.
+bandBudget = 256 * 2 ** 20
+bandPixelBytes = 160
 
 class Blender:
-    def __init__(self, startImage, startPoints, endImage, endPoints):
+    def __init__(self, startImage, startPoints, endImage, endPoints, precision = 'float32', cache = None, profiler = None, simplices = None, startGeometry = None):
         # Validate startImage input.
-        if not isinstance(startImage, np.ndarray):
-            raise TypeError("startImage must be a numpy array.")
+        if not isImage(startImage):
+            raise TypeError("startImage must be a numpy array or TiledImage.")
 
         # Validate startPoints input.
         if not isinstance(startPoints, np.ndarray):
             raise TypeError("startPoints must be a numpy array.")
 
         # Validate endImage input.
-        if not isinstance(endImage, np.ndarray):
-            raise TypeError("endImage must be a numpy array.")
+        if not isImage(endImage):
+            raise TypeError("endImage must be a numpy array or TiledImage.")
 
         # Validate endPoints input.
         if not isinstance(endPoints, np.ndarray):
             raise TypeError("endPoints must be a numpy array.")
 
-        # Define triangulation.
-        simplices = spatial.Delaunay(startPoints).simplices
-
-        # Initialize blender data.
-        self.startImage = startImage
-        self.startPoints = startPoints
-        self.endImage = endImage
-        self.endPoints = endPoints
-        self.simplices = simplices
-
-    def getBlendedImage(self, alpha):
-        # Initialize blended image components.
-        target1 = np.empty(self.startImage.shape, dtype = 'float64')
-        target2 = np.empty(self.endImage.shape, dtype = 'float64')
-
-        # Process all triangles.
-        targets = (1 - alpha) * self.startPoints + alpha * self.endPoints
-        for triangle in self.simplices.tolist():
-            # Define relevant points.
-            src = self.startPoints[triangle]
-            dst = self.endPoints[triangle]
-            tar = targets[triangle]
-
-            # Define affine transforms.
-            Affine(src, tar).transform(self.startImage, target1)
-            Affine(dst, tar).transform(self.endImage, target2)
-
-        # Alpha blend images.
-        target = (1 - alpha) * target1 + alpha * target2
-
-        return target.astype('uint8')
-
-    def generateMorphVideo(self, targetFolderPath, sequenceLength, includeReversed):
-        # Create target folder path if it does not already exist.
-        if not os.path.exists(targetFolderPath): os.makedirs(targetFolderPath)
-
-        # Initialize MP4
-        writer = imageio.get_writer(targetFolderPath + '/morph.mp4', fps = 5, macro_block_size = None)
-        frames = np.empty([sequenceLength, self.startImage.shape[0], self.startImage.shape[1]], dtype = 'uint8')
-
-        # Save initial frame.
-        frame = self.startImage
-        frames[0] = frame
-
-        # Save initial image.
-        frame = Image.fromarray(frame).convert('L')
-        frame.save(targetFolderPath + '/frame001.jpg')
-
-        if includeReversed:
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength * 2))
-
-        # Generate blends.
-        i = 2
-        for alpha in np.arange(1 / (sequenceLength - 1), 1, 1 / (sequenceLength - 1)).tolist():
-            # Save frame.
-            frame = self.getBlendedImage(alpha)
-            frames[i - 1] = frame
-
-            # Save image.
-            frame = Image.fromarray(frame).convert('L')
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(i))
-
-            if includeReversed:
-                frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength * 2 - i + 1))
-
-            i += 1
-
-        # Save final frame.
-        frame = self.endImage
-        frames[-1] = frame
-
-        # Save final image.
-        frame = Image.fromarray(self.endImage).convert('L')
-        frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(i))
-
-        if includeReversed:
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength + 1))
-
-        # Append forward frames.
-        for frame in frames:
-            writer.append_data(frame)
-
-        # Append reversed frames.
-        if includeReversed:
-            for frame in np.flip(frames, 0):
-                writer.append_data(frame)
-
-        # Finalize MP4
-        writer.close()
-
-class ColorAffine:
-    def __init__(self, source, destination):
-        # Validate source input.
-        if source.dtype != 'float64':
-            raise ValueError("source must be a numpy array of type float64.")
-        if source.shape != (3, 2):
-            raise ValueError("source must be a 3x2 array.")
-
-        # Validate destination input.
-        if destination.dtype != 'float64':
-            raise ValueError("destination must be a numpy array of type float64.")
-        if destination.shape != (3, 2):
-            raise ValueError("destination must be a 3x2 array.")
-
-        # Define combined source data matrix.
-        A = np.array([[source[0, 0], source[0, 1], 1, 0, 0, 0],
-                      [0, 0, 0, source[0, 0], source[0, 1], 1],
-                      [source[1, 0], source[1, 1], 1, 0, 0, 0],
-                      [0, 0, 0, source[1, 0], source[1, 1], 1],
-                      [source[2, 0], source[2, 1], 1, 0, 0, 0],
-                      [0, 0, 0, source[2, 0], source[2, 1], 1]], dtype = 'float64')
-
-        # Define combined destination matrix.
-        b = np.reshape(destination, (6, 1))
+        # Validate image shapes.
+        if startImage.shape != endImage.shape:
+            raise ValueError("startImage and endImage must have the same shape.")
 
-        # Solve for transformation matrix.
-        h = np.linalg.solve(A, b)
+        # Validate precision input.
+        if precision not in ('float32', 'float64'):
+            raise ValueError("precision must be float32 or float64.")
 
-        # Define combined transformation matrix data.
-        matrix = np.vstack([np.reshape(h, (2, 3)), [0, 0, 1]])
+        # Validate cache input.
+        if cache is not None and not isinstance(cache, FrameCache):
+            raise TypeError("cache must be a FrameCache.")
 
-        # Initialize affine transform data.
-        self.source = source
-        self.destination = destination
-        self.matrix = matrix
+        # Validate profiler input.
+        if profiler is None:
+            profiler = nullProfiler
+        elif not isinstance(profiler, (Profiler, NullProfiler)):
+            raise TypeError("profiler must be a Profiler.")
 
-    def transform(self, sourceImage, destinationImage):
-        # Validate sourceImage input.
-        if not isinstance(sourceImage, np.ndarray):
-            raise TypeError("sourceImage must be a numpy array.")
+        # Validate startGeometry input.
+        if startGeometry is not None and not isinstance(startGeometry, TriangleGeometry):
+            raise TypeError("startGeometry must be a TriangleGeometry.")
 
-        # Validate destinationImage input.
-        if not isinstance(destinationImage, np.ndarray):
-            raise TypeError("destinationImage must be a numpy array.")
-
-        # Define vectorizations.
-        hInv = np.linalg.inv(self.matrix)
-        getCoord = np.vectorize(lambda x, y, a: hInv[a, 0] * y + hInv[a, 1] * x + hInv[a, 2], otypes = [np.float64])
-
-        # Generate spline.
-        xRange = np.arange(np.amin(self.source[:, 1]), np.amax(self.source[:, 1]), 1)
-        yRange = np.arange(np.amin(self.source[:, 0]), np.amax(self.source[:, 0]), 1)
-        zRange = sourceImage[int(xRange[0]):int(xRange[-1] + 1), int(yRange[0]):int(yRange[-1] + 1)]
-        rSpline = interpolate.RectBivariateSpline(xRange, yRange, np.compress([1, 0, 0], zRange, axis = 2), kx = 1, ky = 1)
-        gSpline = interpolate.RectBivariateSpline(xRange, yRange, np.compress([0, 1, 0], zRange, axis = 2), kx = 1, ky = 1)
-        bSpline = interpolate.RectBivariateSpline(xRange, yRange, np.compress([0, 0, 1], zRange, axis = 2), kx = 1, ky = 1)
-
-
-        # Generate transformation mask.
-        mask = Image.new('L', (destinationImage.shape[1], destinationImage.shape[0]), 0)
-        ImageDraw.Draw(mask).polygon(self.destination.ravel().tolist(), outline = 255, fill = 255)
-        xp, yp = np.nonzero(mask)
-
-        # Find transformed coordinates and values.
-        x = getCoord(xp, yp, 1)
-        y = getCoord(xp, yp, 0)
-        destinationImage[xp, yp] = np.transpose([rSpline.ev(x, y), gSpline.ev(x, y), bSpline.ev(x, y)])
-
-class ColorBlender:
-    def __init__(self, startImage, startPoints, endImage, endPoints):
-        # Validate startImage input.
-        if not isinstance(startImage, np.ndarray):
-            raise TypeError("startImage must be a numpy array.")
-
-        # Validate startPoints input.
-        if not isinstance(startPoints, np.ndarray):
-            raise TypeError("startPoints must be a numpy array.")
-
-        # Validate endImage input.
-        if not isinstance(endImage, np.ndarray):
-            raise TypeError("endImage must be a numpy array.")
-
-        # Validate endPoints input.
-        if not isinstance(endPoints, np.ndarray):
-            raise TypeError("endPoints must be a numpy array.")
-
-        # Define triangulation.
-        simplices = spatial.Delaunay(startPoints).simplices
+        # Define triangulation, unless one is shared with other blenders.
+        if simplices is None:
+            with profiler.stage('delaunay'):
+                simplices = spatial.Delaunay(startPoints).simplices
+        simplices = sortSimplices(simplices)
 
         # Initialize blender data.
         self.startImage = startImage
@@ -274,83 +598,540 @@ class ColorBlender:
         self.endImage = endImage
         self.endPoints = endPoints
         self.simplices = simplices
-
-    def getBlendedImage(self, alpha):
-        # Initialize blended image components.
-        target1 = np.empty(self.startImage.shape, dtype = 'float64')
-        target2 = np.empty(self.endImage.shape, dtype = 'float64')
-
-        # Process all triangles.
+        self.engine = WarpEngine(startImage.shape, simplices)
+        with profiler.stage('geometry'):
+            self.startGeometry = startGeometry if startGeometry is not None else TriangleGeometry(startPoints, simplices)
+            self.endGeometry = TriangleGeometry(endPoints, simplices)
+        self.precision = precision
+        self.buffers = None
+        self.triangulation = None
+        self.cachedFrames = {}
+        self.cache = cache
+        self.cacheKey = None
+        self.profiler = profiler
+        self.maps = None
+
+    @classmethod
+    def fromImages(cls, images, pointSets, precision = 'float32', cache = None, profiler = None):
+        return cls(images[0], pointSets[0], images[1], pointSets[1], precision, cache, profiler)
+
+    def getImages(self):
+        return [self.startImage, self.endImage]
+
+    def getPointSets(self):
+        return [self.startPoints, self.endPoints]
+
+    def getBuffers(self):
+        # Allocate warp buffers once and reuse them for every frame.
+        if self.buffers is None:
+            self.buffers = (np.empty(self.startImage.shape, dtype = self.precision), np.empty(self.endImage.shape, dtype = self.precision))
+
+        return self.buffers
+
+    def composite(self, alpha, target1, target2, out):
+        # Alpha blend images in place; alpha may also be broadcast per frame.
+        np.multiply(target1, np.asarray(1 - alpha, dtype = target1.dtype), out = target1)
+        np.multiply(target2, np.asarray(alpha, dtype = target2.dtype), out = target2)
+        np.add(target1, target2, out = target1)
+
+        # Round and clip into the range of integer outputs.
+        if np.issubdtype(out.dtype, np.integer):
+            limits = np.iinfo(out.dtype)
+            np.rint(target1, out = target1)
+            np.clip(target1, limits.min, limits.max, out = target1)
+        np.copyto(out, target1, casting = 'unsafe')
+
+    def getBlendedImage(self, alpha, perTriangle = False, useLambda = False, threads = 1, tiles = None, out = None):
+        # Validate out input.
+        if out is None:
+            out = np.empty(self.startImage.shape, dtype = self.startImage.dtype)
+        elif not isinstance(out, np.ndarray):
+            raise TypeError("out must be a numpy array.")
+        elif out.shape != self.startImage.shape:
+            raise ValueError("out must have the same shape as startImage.")
+
+        # Reuse a previously rendered frame.
+        if self.cache is not None and not perTriangle and self.maps is None:
+            with self.profiler.stage('cache'):
+                key = self.getCacheKey(alpha)
+                frame = self.cache.get(key)
+            if frame is not None:
+                np.copyto(out, frame)
+                return out
+
+        if perTriangle:
+            # Process all triangles, sharing one coordinate buffer.
+            target1, target2 = self.getBuffers()
+            targets = (1 - alpha) * self.startPoints + alpha * self.endPoints
+            target1.fill(0)
+            target2.fill(0)
+            coordinates = CoordinateBuffer()
+            for i, triangle in enumerate(self.simplices.tolist()):
+                # Define relevant points.
+                src = self.startPoints[triangle]
+                dst = self.endPoints[triangle]
+                tar = targets[triangle]
+
+                # Define affine transforms.
+                Affine(src, tar, self.profiler).transform(self.startImage, target1, coordinates, useLambda, self.engine.boundary[i])
+                Affine(dst, tar, self.profiler).transform(self.endImage, target2, coordinates, useLambda, self.engine.boundary[i])
+            with self.profiler.stage('composite', out.shape[0] * out.shape[1]):
+                self.composite(alpha, target1, target2, out)
+        elif self.maps is not None:
+            # Remap through displacement fields interpolated from the nearest keyframes.
+            self.maps.render(alpha, out)
+        elif self.getBandHeight(threads) < out.shape[0]:
+            # Render frames larger than the band budget without any full-frame working arrays.
+            self.renderBands(alpha, out, threads, tiles)
+            if self.cache is not None: self.cache.put(key, out)
+        else:
+            self.renderFrame(alpha, out, threads, tiles)
+            if self.cache is not None: self.cache.put(key, out)
+
+        return out
+
+    def getBlendedImages(self, alphas, out = None, chunkSize = None):
+        # Validate alphas input.
+        alphas = np.asarray(alphas, dtype = 'float64')
+        if alphas.ndim != 1:
+            raise ValueError("alphas must be a one-dimensional array.")
+        shape = (alphas.size,) + self.startImage.shape
+
+        # Validate out input.
+        if out is None:
+            out = np.empty(shape, dtype = self.startImage.dtype)
+        elif not isinstance(out, np.ndarray):
+            raise TypeError("out must be a numpy array.")
+        elif out.shape != shape:
+            raise ValueError("out must stack one frame per alpha.")
+
+        # Remap every frame through displacement fields when they are precomputed.
+        if self.maps is not None:
+            for i, alpha in enumerate(alphas.tolist()):
+                self.maps.render(alpha, out[i])
+            return out
+
+        # Render frames larger than the band budget one at a time, band by band.
+        if self.getBandHeight() < self.startImage.shape[0]:
+            for i, alpha in enumerate(alphas.tolist()):
+                self.getBlendedImage(alpha, out = out[i])
+            return out
+
+        # Validate chunkSize input, defaulting to as many frames as fit the batch budget.
+        if chunkSize is None:
+            bufferBytes = 2 * int(np.prod(self.startImage.shape)) * np.dtype(self.precision).itemsize
+            chunkSize = max(int(batchBudget // (self.startImage.shape[0] * self.startImage.shape[1] * batchPixelBytes + bufferBytes)), 1)
+        elif int(chunkSize) < 1:
+            raise ValueError("chunkSize must be a positive integer.")
+
+        # Reuse previously rendered frames.
+        pending = np.arange(alphas.size)
+        if self.cache is not None:
+            with self.profiler.stage('cache'):
+                frames = [self.cache.get(self.getCacheKey(alpha)) for alpha in alphas.tolist()]
+            for i, frame in enumerate(frames):
+                if frame is not None: np.copyto(out[i], frame)
+            pending = np.array([i for i, frame in enumerate(frames) if frame is None], dtype = 'intp')
+
+        # Render remaining frames in chunks, sharing warp buffers between chunks.
+        chunkSize = min(int(chunkSize), max(pending.size, 1))
+        buffers = (np.empty((chunkSize,) + self.startImage.shape, dtype = self.precision), np.empty((chunkSize,) + self.endImage.shape, dtype = self.precision))
+        for start in range(0, pending.size, chunkSize):
+            indices = pending[start:start + chunkSize]
+            contiguous = indices[-1] - indices[0] + 1 == indices.size
+            frames = out[indices[0]:indices[-1] + 1] if contiguous else np.empty((indices.size,) + self.startImage.shape, dtype = out.dtype)
+            self.renderStack(alphas[indices], frames, buffers[0][:indices.size], buffers[1][:indices.size])
+            if not contiguous: out[indices] = frames
+            if self.cache is not None:
+                for i, alpha in zip(indices.tolist(), alphas[indices].tolist()):
+                    self.cache.put(self.getCacheKey(alpha), out[i])
+
+        return out
+
+    def renderStack(self, alphas, out, target1, target2):
+        # Scan and invert the target triangles of every frame at once.
+        weights = alphas[:, np.newaxis, np.newaxis]
+        targets = (1 - weights) * self.startPoints + weights * self.endPoints
+        with self.profiler.stage('rasterize', out.shape[0] * out.shape[1] * out.shape[2]):
+            indexMaps = self.engine.rasterizeStack(targets[:, self.simplices])
+        with self.profiler.stage('invert'):
+            targetInverses = self.engine.getTargetInverses(self.startGeometry, self.endGeometry, alphas)
+
+        # Warp both images for all frames, then blend with per-frame weights.
+        target1.fill(0)
+        target2.fill(0)
+        with self.profiler.stage('warp') as stage:
+            stage.pixels = self.engine.warpStack(self.startImage, self.startGeometry, targetInverses, indexMaps, target1)
+            stage.pixels += self.engine.warpStack(self.endImage, self.endGeometry, targetInverses, indexMaps, target2)
+        with self.profiler.stage('composite', out.shape[0] * out.shape[1] * out.shape[2]):
+            self.composite(alphas.reshape((-1,) + (1,) * (out.ndim - 1)), target1, target2, out)
+
+        return indexMaps
+
+    def precomputeMaps(self, alphas = 33, dtype = 'float16', path = None):
+        # Switch to rendering through displacement fields sampled at keyframe alphas.
+        with self.profiler.stage('maps'):
+            self.maps = DisplacementMaps(self, alphas, dtype, path)
+
+        return self.maps
+
+    def getCacheKey(self, alpha):
+        # Hash image, point and triangulation contents once per point set, apart per precision.
+        if self.cacheKey is None:
+            self.cacheKey = hashArrays(self.startImage, self.startPoints, self.endImage, self.endPoints, self.simplices) + '-' + self.precision
+
+        return self.cache.getKey(self.cacheKey, alpha, self.startImage.shape)
+
+    def renderFrame(self, alpha, out, threads = 1, tiles = None):
+        # Warp both images through a shared target index map.
+        target1, target2 = self.getBuffers()
         targets = (1 - alpha) * self.startPoints + alpha * self.endPoints
-        for triangle in self.simplices.tolist():
-            # Define relevant points.
-            src = self.startPoints[triangle]
-            dst = self.endPoints[triangle]
-            tar = targets[triangle]
-
-            # Define affine transforms.
-            ColorAffine(src, tar).transform(self.startImage, target1)
-            ColorAffine(dst, tar).transform(self.endImage, target2)
-
-        # Alpha blend images.
-        target = (1 - alpha) * target1 + alpha * target2
-
-        return target.astype('uint8')
-
-    def generateMorphVideo(self, targetFolderPath, sequenceLength, includeReversed):
-        # Create target folder path if it does not already exist.
-        if not os.path.exists(targetFolderPath): os.makedirs(targetFolderPath)
-
-        # Initialize MP4
-        writer = imageio.get_writer(targetFolderPath + '/morph.mp4', fps = 5, macro_block_size = None)
-        frames = np.empty([sequenceLength, self.startImage.shape[0], self.startImage.shape[1], self.startImage.shape[2]], dtype = 'uint8')
-
-        # Save initial frame.
-        frame = self.startImage
-        frames[0] = frame
-
-        # Save initial image.
-        frame = Image.fromarray(frame).convert('RGB')
-        frame.save(targetFolderPath + '/frame001.jpg')
-
-        if includeReversed:
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength * 2))
-
-        # Generate blends.
-        i = 2
-        for alpha in np.arange(1 / (sequenceLength - 1), 1, 1 / (sequenceLength - 1)).tolist():
-            # Save frame.
-            frame = self.getBlendedImage(alpha)
-            frames[i - 1] = frame
-
-            # Save image.
-            frame = Image.fromarray(frame).convert('RGB')
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(i))
-
-            if includeReversed:
-                frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength * 2 - i + 1))
-
-            i += 1
-
-        # Save final frame.
-        frame = self.endImage
-        frames[-1] = frame
-
-        # Save final image.
-        frame = Image.fromarray(frame).convert('RGB')
-        frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(i))
-
-        if includeReversed:
-            frame.save(targetFolderPath + '/frame{:03d}.jpg'.format(sequenceLength + 1))
-
-        # Append forward frames.
-        for frame in frames:
-            writer.append_data(frame)
-
-        # Append reversed frames.
-        if includeReversed:
-            for frame in np.flip(frames, 0):
-                writer.append_data(frame)
-
-        # Finalize MP4
-        writer.close()
+        with self.profiler.stage('rasterize', out.shape[0] * out.shape[1]):
+            indexMap = self.engine.rasterize(targets[self.simplices])
+        with self.profiler.stage('invert'):
+            targetInverse = self.engine.getTargetInverse(self.startGeometry, self.endGeometry, alpha)
+
+        # Warp and blend each band of rows, optionally on a thread pool.
+        def renderTile(start, stop):
+            target1[start:stop] = 0
+            target2[start:stop] = 0
+            with self.profiler.stage('warp') as stage:
+                stage.pixels = self.engine.warp(self.startImage, self.startGeometry, targetInverse, indexMap, target1, (start, stop))
+                stage.pixels += self.engine.warp(self.endImage, self.endGeometry, targetInverse, indexMap, target2, (start, stop))
+            with self.profiler.stage('composite', (stop - start) * out.shape[1]):
+                self.composite(alpha, target1[start:stop], target2[start:stop], out[start:stop])
+        self.engine.forEachTile(renderTile, threads, tiles)
+
+        return indexMap
+
+    def getBandHeight(self, threads = 1):
+        # Fit the working set of every band rendered at once within the band budget.
+        height, width = self.startImage.shape[:2]
+        channels = self.startImage.shape[2] if self.startImage.ndim == 3 else 1
+        pixelBytes = bandPixelBytes + 2 * channels * np.dtype(self.precision).itemsize
+
+        return min(height, max(int(bandBudget // (width * pixelBytes * int(threads))), 1))
+
+    def renderBands(self, alpha, out, threads = 1, tiles = None):
+        # Interpolate and invert the target triangles once for all bands.
+        height = out.shape[0]
+        corners = ((1 - alpha) * self.startPoints + alpha * self.endPoints)[self.simplices]
+        with self.profiler.stage('invert'):
+            targetInverse = self.engine.getTargetInverse(self.startGeometry, self.endGeometry, alpha)
+
+        # Rasterize, warp and blend each band into its rows of out, with band-sized index maps and buffers.
+        def renderBand(start, stop):
+            with self.profiler.stage('rasterize', (stop - start) * out.shape[1]):
+                indexMap = self.engine.rasterize(corners, (start, stop))
+            target1 = np.zeros((stop - start,) + self.startImage.shape[1:], dtype = self.precision)
+            target2 = np.zeros((stop - start,) + self.endImage.shape[1:], dtype = self.precision)
+            with self.profiler.stage('warp') as stage:
+                stage.pixels = self.engine.warp(self.startImage, self.startGeometry, targetInverse, indexMap, target1, top = start)
+                stage.pixels += self.engine.warp(self.endImage, self.endGeometry, targetInverse, indexMap, target2, top = start)
+            with self.profiler.stage('composite', (stop - start) * out.shape[1]):
+                self.composite(alpha, target1, target2, out[start:stop])
+        bands = -(-height // self.getBandHeight(threads))
+        self.engine.forEachTile(renderBand, threads, max(bands, int(tiles or 0)))
+
+    def getCachedImage(self, alpha, threads = 1):
+        # Render and keep frames that point edits should update incrementally.
+        if alpha not in self.cachedFrames:
+            frame = self.cache.get(self.getCacheKey(alpha)) if self.cache is not None else None
+            if frame is not None:
+                targets = (1 - alpha) * self.startPoints + alpha * self.endPoints
+                self.cachedFrames[alpha] = (np.array(frame), self.engine.rasterize(targets[self.simplices]))
+            else:
+                frame = np.empty(self.startImage.shape, dtype = self.startImage.dtype)
+                self.cachedFrames[alpha] = (frame, self.renderFrame(alpha, frame, threads))
+                if self.cache is not None: self.cache.put(self.getCacheKey(alpha), frame)
+
+        return self.cachedFrames[alpha][0]
+
+    def getTriangleKeys(self):
+        # Identify triangles by their start and end vertices, independent of point order.
+        corners = np.concatenate([self.startGeometry.corners, self.endGeometry.corners], axis = 2)
+
+        return [tuple(sorted(map(tuple, triangle))) for triangle in corners.tolist()]
+
+    def addPoint(self, startPoint, endPoint):
+        # Insert point into the existing triangulation.
+        if self.triangulation is None:
+            self.triangulation = spatial.Delaunay(self.startPoints, incremental = True)
+        self.triangulation.add_points([startPoint])
+
+        return self.updatePoints(np.vstack((self.startPoints, [startPoint])), np.vstack((self.endPoints, [endPoint])))
+
+    def movePoint(self, index, startPoint, endPoint):
+        # Replace point and retriangulate.
+        startPoints = np.array(self.startPoints, dtype = 'float64')
+        endPoints = np.array(self.endPoints, dtype = 'float64')
+        startPoints[index] = startPoint
+        endPoints[index] = endPoint
+        self.triangulation = spatial.Delaunay(startPoints, incremental = True)
+
+        return self.updatePoints(startPoints, endPoints)
+
+    def deletePoint(self, index):
+        # Remove point and retriangulate.
+        startPoints = np.delete(self.startPoints, index, axis = 0)
+        endPoints = np.delete(self.endPoints, index, axis = 0)
+        self.triangulation = spatial.Delaunay(startPoints, incremental = True)
+
+        return self.updatePoints(startPoints, endPoints)
+
+    def updatePoints(self, startPoints, endPoints):
+        # Rebuild geometry for the new triangulation.
+        previousKeys = self.getTriangleKeys()
+        self.startPoints = startPoints
+        self.endPoints = endPoints
+        self.cacheKey = None
+        self.maps = None
+        self.simplices = sortSimplices(self.triangulation.simplices)
+        self.engine = WarpEngine(self.startImage.shape, self.simplices)
+        self.startGeometry = TriangleGeometry(startPoints, self.simplices)
+        self.endGeometry = TriangleGeometry(endPoints, self.simplices)
+
+        # Mark triangles whose geometry changed as dirty.
+        keys = self.getTriangleKeys()
+        indices = {key: i for i, key in enumerate(keys)}
+        previous = set(previousKeys)
+        dirty = np.array([key not in previous for key in keys], dtype = bool)
+
+        # Map previous triangle indices to current ones; removed triangles never match, uncovered stays -1.
+        previousToCurrent = np.array([indices.get(key, -2) for key in previousKeys] + [-1], dtype = 'int32')
+
+        # Re-warp only pixels whose covering triangle changed in each cached frame.
+        target1, target2 = self.getBuffers()
+        for alpha, (frame, previousMap) in self.cachedFrames.items():
+            targets = (1 - alpha) * startPoints + alpha * endPoints
+            indexMap = self.engine.rasterize(targets[self.simplices])
+            changed = previousToCurrent[previousMap] != indexMap
+            pixels = np.flatnonzero(changed & (indexMap >= 0))
+            frame.reshape((-1,) + frame.shape[2:])[np.flatnonzero(changed & (indexMap < 0))] = 0
+
+            # Warp and blend the changed pixels.
+            targetInverse = self.engine.getTargetInverse(self.startGeometry, self.endGeometry, alpha)
+            self.engine.warp(self.startImage, self.startGeometry, targetInverse, indexMap, target1, pixels = pixels)
+            self.engine.warp(self.endImage, self.endGeometry, targetInverse, indexMap, target2, pixels = pixels)
+            flatFrame = frame.reshape((-1,) + frame.shape[2:])
+            warped1 = target1.reshape(flatFrame.shape)[pixels]
+            warped2 = target2.reshape(flatFrame.shape)[pixels]
+            blended = np.empty(warped1.shape, dtype = frame.dtype)
+            self.composite(alpha, warped1, warped2, blended)
+            flatFrame[pixels] = blended
+            self.cachedFrames[alpha] = (frame, indexMap)
+            if self.cache is not None: self.cache.put(self.getCacheKey(alpha), frame)
+
+        return np.flatnonzero(dirty)
+
+    def iterBlendedFrames(self, alphas, workers = 1):
+        # Yield blended frames one at a time, in order.
+        for frame in renderFrames(self, alphas, workers):
+            yield frame
+
+    def generateMorphVideo(self, targetFolderPath, sequenceLength, includeReversed, workers = 1, reverseMode = 'hardlink', sinks = None, queueSize = 8, onProgress = None):
+        # Validate sequenceLength input.
+        if int(sequenceLength) < 2:
+            raise ValueError("sequenceLength must be at least 2.")
+
+        # Stream initial image, blends and final image to the encoder thread.
+        alphas = np.linspace(0, 1, sequenceLength)[1:-1].tolist()
+        def sequence():
+            yield np.asarray(self.startImage)
+            yield from self.iterBlendedFrames(alphas, workers)
+            yield np.asarray(self.endImage)
+
+        return streamFrames(sequence(), targetFolderPath, sequenceLength, includeReversed, self.startImage.shape, self.profiler, reverseMode, sinks, queueSize, onProgress)
+
+class DisplacementMaps:
+    def __init__(self, blender, alphas = 33, dtype = 'float16', path = None, fields = None):
+        # Validate alphas input; an integer selects evenly spaced keyframes.
+        if np.ndim(alphas) == 0: alphas = np.linspace(0, 1, int(alphas))
+        alphas = np.asarray(alphas, dtype = 'float64')
+        if alphas.ndim != 1 or alphas.size < 2 or alphas[0] != 0 or alphas[-1] != 1 or np.any(np.diff(alphas) <= 0):
+            raise ValueError("alphas must increase from 0 to 1.")
+
+        # Validate dtype input.
+        if np.dtype(dtype) not in (np.float16, np.float32):
+            raise ValueError("dtype must be float16 or float32.")
+
+        # Validate fields input, reused from maps computed in another process.
+        height, width = blender.engine.shape
+        shape = (alphas.size, 2, 2, height, width)
+        if fields is not None and fields.shape != shape:
+            raise ValueError("fields must hold two displacement fields per image and keyframe.")
+
+        # Store fields in memory or memory-mapped on disk: keyframe, image, row and column displacement.
+        if fields is None:
+            fields = np.lib.format.open_memmap(path, mode = 'w+', dtype = dtype, shape = shape) if path is not None else np.empty(shape, dtype = dtype)
+
+            # Record each covered pixel's offset to its source in both images; uncovered pixels are NaN.
+            field = np.empty((2, height * width), dtype = 'float32')
+            for i, alpha in enumerate(alphas.tolist()):
+                targets = (1 - alpha) * blender.startPoints + alpha * blender.endPoints
+                indexMap = blender.engine.rasterize(targets[blender.simplices])
+                targetInverse = blender.engine.getTargetInverse(blender.startGeometry, blender.endGeometry, alpha)
+                pixels = np.flatnonzero(indexMap >= 0)
+                rows, cols = np.divmod(pixels, width)
+                for j, geometry in enumerate((blender.startGeometry, blender.endGeometry)):
+                    x, y = blender.engine.getSourceCoordinates(geometry, targetInverse, indexMap, pixels)
+                    field.fill(np.nan)
+                    field[0, pixels] = x - rows
+                    field[1, pixels] = y - cols
+                    fields[i, j] = field.reshape(2, height, width)
+            if path is not None: fields.flush()
+
+        # Initialize displacement map data.
+        self.blender = blender
+        self.alphas = alphas
+        self.fields = fields
+        self.path = path
+
+    def render(self, alpha, out):
+        # Find surrounding keyframes and the weight between them.
+        index = min(max(int(np.searchsorted(self.alphas, alpha, side = 'right')) - 1, 0), self.alphas.size - 2)
+        weight = (alpha - self.alphas[index]) / (self.alphas[index + 1] - self.alphas[index])
+        blender = self.blender
+        target1, target2 = blender.getBuffers()
+        width = blender.engine.shape[1]
+
+        # Interpolate both fields and remap each image once.
+        for j, (image, target) in enumerate(((blender.startImage, target1), (blender.endImage, target2))):
+            with blender.profiler.stage('interpolate', out.shape[0] * out.shape[1]):
+                field = self.fields[index, j].astype('float32') * np.float32(1 - weight) + self.fields[index + 1, j].astype('float32') * np.float32(weight)
+                pixels = np.flatnonzero(~np.isnan(field[0]))
+                rows, cols = np.divmod(pixels, width)
+            with blender.profiler.stage('remap', pixels.size):
+                target.fill(0)
+                target.reshape((-1,) + target.shape[2:])[pixels] = bilinearSample(image, field[0].ravel()[pixels] + rows, field[1].ravel()[pixels] + cols, target.dtype)
+        with blender.profiler.stage('composite', out.shape[0] * out.shape[1]):
+            blender.composite(alpha, target1, target2, out)
+
+        return out
+
+class ColorAffine(Affine):
+    # Affine samples any number of channels; kept for existing callers.
+    pass
+
+class ColorBlender(Blender):
+    def __init__(self, startImage, startPoints, endImage, endPoints, precision = 'float32', cache = None, profiler = None, simplices = None, startGeometry = None):
+        # Validate channel axis.
+        if isImage(startImage) and startImage.ndim != 3:
+            raise ValueError("startImage must have a channel axis.")
+
+        super(ColorBlender, self).__init__(startImage, startPoints, endImage, endPoints, precision, cache, profiler, simplices, startGeometry)
+
+easings = {'linear': lambda t: t,
+           'easeIn': lambda t: t * t,
+           'easeOut': lambda t: t * (2 - t),
+           'easeInOut': lambda t: t * t * (3 - 2 * t)}
+
+class SequenceBlender:
+    def __init__(self, images, pointSets, frameCounts = 20, easing = 'linear', precision = 'float32', cache = None, profiler = None):
+        # Validate images input.
+        if len(images) < 2:
+            raise ValueError("images must contain at least two keyframes.")
+        for image in images:
+            if not isImage(image):
+                raise TypeError("images must contain numpy arrays or TiledImages.")
+            if image.shape != images[0].shape:
+                raise ValueError("images must all have the same shape.")
+
+        # Validate pointSets input.
+        if len(pointSets) != len(images):
+            raise ValueError("pointSets must contain one point set per image.")
+        for points in pointSets:
+            if not isinstance(points, np.ndarray):
+                raise TypeError("pointSets must contain numpy arrays.")
+            if points.shape != pointSets[0].shape:
+                raise ValueError("pointSets must all have the same shape.")
+
+        # Validate frameCounts input, one count per segment.
+        if np.ndim(frameCounts) == 0: frameCounts = [frameCounts] * (len(images) - 1)
+        if len(frameCounts) != len(images) - 1 or min(frameCounts) < 1:
+            raise ValueError("frameCounts must be a positive integer per segment.")
+
+        # Validate easing input, one curve per segment.
+        if isinstance(easing, str) or callable(easing): easing = [easing] * (len(images) - 1)
+        if len(easing) != len(images) - 1:
+            raise ValueError("easing must be a curve per segment.")
+        for curve in easing:
+            if not callable(curve) and curve not in easings:
+                raise ValueError("easing must be callable or one of " + ', '.join(sorted(easings)) + ".")
+
+        # Validate profiler input.
+        if profiler is None:
+            profiler = nullProfiler
+        elif not isinstance(profiler, (Profiler, NullProfiler)):
+            raise TypeError("profiler must be a Profiler.")
+
+        # Triangulate once and share geometry between neighbouring segments.
+        with profiler.stage('delaunay'):
+            simplices = sortSimplices(spatial.Delaunay(pointSets[0]).simplices)
+        segments = []
+        for i in range(len(images) - 1):
+            segments.append(Blender(images[i], pointSets[i], images[i + 1], pointSets[i + 1], precision, cache, profiler, simplices, segments[-1].endGeometry if segments else None))
+
+        # Initialize sequence data.
+        self.images = list(images)
+        self.pointSets = list(pointSets)
+        self.frameCounts = [int(count) for count in frameCounts]
+        self.easing = [easings[curve] if not callable(curve) else curve for curve in easing]
+        self.simplices = simplices
+        self.segments = segments
+        self.precision = precision
+        self.cache = cache
+        self.profiler = profiler
+        self.buffers = None
+
+    @classmethod
+    def fromImages(cls, images, pointSets, precision = 'float32', cache = None, profiler = None):
+        return cls(images, pointSets, precision = precision, cache = cache, profiler = profiler)
+
+    def getImages(self):
+        return self.images
+
+    def getPointSets(self):
+        return self.pointSets
+
+    def getKeyframeIndices(self):
+        # Frame numbers of the keyframes in the full sequence.
+        return np.cumsum([0] + self.frameCounts).tolist()
+
+    def getPositions(self):
+        # Place frames as (segment, alpha) pairs, easing the alpha within each segment; segments come from the frame counter.
+        positions = []
+        for i, (count, curve) in enumerate(zip(self.frameCounts, self.easing)):
+            positions += [(i, 0.0)] + [(i, min(max(float(curve(k / count)), 0.0), 1.0)) for k in range(1, count)]
+
+        return positions + [(len(self.segments) - 1, 1.0)]
+
+    def getBlendedImage(self, position, threads = 1, tiles = None, out = None):
+        # Find segment and its local alpha, from a (segment, alpha) pair or a position whose whole part selects the segment.
+        if isinstance(position, tuple):
+            index, alpha = position
+        else:
+            index = min(max(int(math.floor(position)), 0), len(self.segments) - 1)
+            alpha = position - index
+        segment = self.segments[index]
+
+        # Share warp buffers between segments, once a segment renders whole frames.
+        segment.buffers = self.buffers
+        out = segment.getBlendedImage(alpha, threads = threads, tiles = tiles, out = out)
+        self.buffers = segment.buffers
+
+        return out
+
+    def generateMorphVideo(self, targetFolderPath, includeReversed, workers = 1, reverseMode = 'hardlink', sinks = None, queueSize = 8, onProgress = None):
+        # Stream keyframes and blends of every segment as one sequence, rendering across segments in parallel.
+        positions = self.getPositions()
+        keyframes = {frame: i for i, frame in enumerate(self.getKeyframeIndices())}
+        def sequence():
+            frames = renderFrames(self, [position for i, position in enumerate(positions) if i not in keyframes], workers)
+            try:
+                for i in range(len(positions)):
+                    yield np.asarray(self.images[keyframes[i]]) if i in keyframes else next(frames)
+            finally:
+                frames.close()
+
+        return streamFrames(sequence(), targetFolderPath, len(positions), includeReversed, self.images[0].shape, self.profiler, reverseMode, sinks, queueSize, onProgress)
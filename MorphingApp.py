@@ -3,11 +3,70 @@ from PySide.QtCore import *
 from PySide.QtGui import *
 from MorphingGUI import *
 from Morphing import *
-import os
-import imageio
+from MorphingPoints import *
+from MorphingPreview import *
+import threading
 import numpy as np
 from scipy import spatial
 
+def toQImage(frame):
+    # Wrap frame pixels in a QImage without an encode round trip.
+    frame = toUint8(frame)
+    if frame.ndim == 3: frame = frame[:, :, :3]
+    frame = np.ascontiguousarray(frame)
+    if frame.ndim == 2:
+        image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_Indexed8)
+        image.setColorTable([qRgb(i, i, i) for i in range(256)])
+    else:
+        image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB888)
+
+    # Detach from the numpy buffer.
+    return image.copy()
+
+class BlendWorker(QThread):
+    frameReady = Signal(int, object)
+
+    def __init__(self, blender, steps, edit = None, parent = None):
+        super(BlendWorker, self).__init__(parent)
+
+        # Initialize worker data.
+        self.blender = blender
+        self.steps = steps
+        self.edit = edit
+        self.pending = []
+        self.lock = threading.Lock()
+        self.active = False
+        self.cancelled = False
+
+    def request(self, values):
+        # Move requested slider values to the front of the queue.
+        with self.lock:
+            self.pending = list(values) + [value for value in self.pending if value not in values]
+            idle = not self.active
+            self.active = True
+
+        return idle
+
+    def run(self):
+        # Apply pending point edit off the main thread.
+        if self.edit is not None:
+            self.edit()
+            self.edit = None
+
+        # Render blends in priority order, publishing each as soon as it is ready.
+        while True:
+            with self.lock:
+                if self.cancelled or not self.pending:
+                    self.active = False
+                    return
+                value = self.pending.pop(0)
+
+            # Keep only keyframes for incremental edits; values between them are rendered on demand.
+            alpha = value / float(self.steps)
+            if value % (self.steps // 20) == 0: frame = self.blender.getCachedImage(alpha)
+            else: frame = self.blender.getBlendedImage(alpha)
+            self.frameReady.emit(value, frame)
+
 class MorphingApp(QMainWindow, Ui_MainWindow):
     def __init__(self, parent=None):
         super(MorphingApp, self).__init__(parent)
@@ -23,10 +82,21 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
         self.hasPresetPoints = False
         self.hasCustomPoints = False
         self.hasPoints = False
+        self.presetCount = 0
+        self.selected = None
         self.state = 'INIT'
-        self.blends = [QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(),
-                       QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(),
-                       QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene(), QGraphicsScene()]
+        self.blender = None
+        self.preview = None
+        self.frameCache = FrameCache(memoryBudget = 512 * 2 ** 20)
+        self.worker = None
+        self.steps = 100
+        self.ready = set()
+        self.blends = [QGraphicsScene() for _ in range(self.steps + 1)]
+
+        # Allow continuous scrubbing; ticks still mark the 21 keyframes.
+        self.sliAlpha.setMaximum(self.steps)
+        self.sliAlpha.setPageStep(self.steps // 2)
+        self.sliAlpha.setTickInterval(self.steps // 20)
 
         # Signal functionality.
         self.gfxStart.setScene(self.startScene)
@@ -47,25 +117,32 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
         if not filePath: return
 
         # Initialize scene and graphics.
-        self.startImage = imageio.imread(filePath)
+        self.stopBlending()
+        self.startImage = openImage(filePath)
+        self.startImagePath = filePath
+        self.blender = None
+        self.selected = None
         self.startScene.clear()
         self.startScene.addPixmap(QPixmap(filePath))
 
-        # Determine existance of point file.
-        self.startFile = filePath + '.txt'
-        if os.path.isfile(self.startFile):
+        # Determine existance of point file, converting legacy text files.
+        self.startPointFile = PointFile(getPointPath(filePath))
+        points = loadPoints(filePath)
+        if points is not None and points.shape[0] > 0:
             # Add correspondences from file.
             pen = QPen(QtCore.Qt.red)
             brush = QBrush(QtCore.Qt.red)
-            self.startPoints = np.loadtxt(self.startFile)
+            self.startPoints = points
             for x, y in self.startPoints:
                 self.startScene.addEllipse(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2, pen, brush)
             self.hasPresetPoints = True
             self.hasCustomPoints = False
             self.hasPoints = True
+            self.presetCount = points.shape[0]
         else:
-            open(self.startFile, 'w').close()
+            PointFile.create(self.startPointFile.path, np.empty((0, 2)))
             self.startPoints = None
+            self.presetCount = 0
             self.hasPresetPoints = False
             self.hasCustomPoints = False
             self.hasPoints = False
@@ -92,26 +169,32 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
         if not filePath: return
 
         # Initialize scene and graphics.
-        self.endImage = imageio.imread(filePath)
+        self.stopBlending()
+        self.endImage = openImage(filePath)
+        self.endImagePath = filePath
+        self.blender = None
+        self.selected = None
         self.endScene.clear()
         self.endScene.addPixmap(QPixmap(filePath))
 
-        # Determine existance of point file.
-        self.endFile = filePath + '.txt'
-        if os.path.isfile(self.endFile):
+        # Determine existance of point file, converting legacy text files.
+        self.endPointFile = PointFile(getPointPath(filePath))
+        points = loadPoints(filePath)
+        if points is not None and points.shape[0] > 0:
             # Add correspondences from file.
             pen = QPen(QtCore.Qt.red)
             brush = QBrush(QtCore.Qt.red)
-            self.endFile = filePath + '.txt'
-            self.endPoints = np.loadtxt(self.endFile)
+            self.endPoints = points
             for x, y in self.endPoints:
                 self.endScene.addEllipse(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2, pen, brush)
             self.hasPresetPoints = True
             self.hasCustomPoints = False
             self.hasPoints = True
+            self.presetCount = points.shape[0]
         else:
-            open(self.endFile, 'w').close()
+            PointFile.create(self.endPointFile.path, np.empty((0, 2)))
             self.endPoints = None
+            self.presetCount = 0
             self.hasPresetPoints = False
             self.hasCustomPoints = False
             self.hasPoints = False
@@ -167,28 +250,97 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
 
     def changeAlpha(self):
         # Rescale and display alpha.
-        self.txtAlpha.setText(str(self.sliAlpha.value() / 20.0))
-        self.gfxBlend.setScene(self.blends[self.sliAlpha.value()])
+        value = self.sliAlpha.value()
+        self.txtAlpha.setText(str(value / float(self.steps)))
+
+        # Show a coarse preview until the full-resolution blend is ready.
+        if self.worker is not None and value not in self.ready:
+            self.showPreview(value)
+            self.requestBlends([value])
+        self.gfxBlend.setScene(self.blends[value])
 
     def blend(self):
         # Check for valid triangulation.
         if self.startPoints is not None and self.startPoints.shape[0] > 2:
-            # Initialize and blend.
-            if self.startImage.ndim is 3: blender = ColorBlender(self.startImage, self.startPoints, self.endImage, self.endPoints)
-            else: blender = Blender(self.startImage, self.startPoints, self.endImage, self.endPoints)
-
-            self.blends[0].addPixmap(QPixmap(self.startFile[:-4]))
-            for alpha in range(1, 20):
-                # Save and display image.
-                Image.fromarray(blender.getBlendedImage(alpha / 20.0)).save('temp.jpg')
-                self.blends[alpha].addPixmap(QPixmap('temp.jpg'))
-                os.remove('temp.jpg')
-            self.blends[20].addPixmap(QPixmap(self.endFile[:-4]))
-            self.changeAlpha()
+            # Initialize blender once per image pair; point edits update it incrementally.
+            edit = None
+            if self.blender is None:
+                self.blender = Blender(self.startImage, self.startPoints, self.endImage, self.endPoints, cache = self.frameCache)
+                self.preview = None
+                startPoints, endPoints = self.startPoints, self.endPoints
+                edit = lambda: self.updatePreview(startPoints, endPoints)
+
+            self.startBlending(edit)
             self.gfxBlend.fitInView(self.blends[0].itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
 
+    def startBlending(self, edit = None):
+        # Stop any blend in progress.
+        self.stopBlending()
+
+        # Display input images immediately.
+        self.blends[0].clear()
+        self.blends[0].addPixmap(QPixmap(self.startImagePath))
+        self.blends[self.steps].clear()
+        self.blends[self.steps].addPixmap(QPixmap(self.endImagePath))
+        self.ready = set([0, self.steps])
+
+        # Render keyframes on a worker thread, nearest to the current alpha first.
+        current = self.sliAlpha.value()
+        keyframes = range(self.steps // 20, self.steps, self.steps // 20)
+        self.worker = BlendWorker(self.blender, self.steps, edit)
+        self.worker.frameReady.connect(self.showBlend)
+        self.requestBlends(sorted(keyframes, key = lambda value: abs(value - current)))
+        self.changeAlpha()
+
+    def updatePreview(self, startPoints, endPoints):
+        # Rebuild preview blenders over the cached image levels, keeping measured render times.
+        preview = PreviewPyramid(self.startImage, startPoints, self.endImage, endPoints)
+        if self.preview is not None and len(self.preview.timings) == len(preview.timings): preview.timings = list(self.preview.timings)
+        self.preview = preview
+
+    def requestBlends(self, values):
+        # Queue blends, restarting the worker once it has drained its queue.
+        if self.worker.request(values):
+            self.worker.wait()
+            self.worker.start()
+
+    def stopBlending(self):
+        # Cancel worker and wait for its current frame.
+        if self.worker is not None:
+            self.worker.cancelled = True
+            self.worker.wait()
+            self.worker = None
+
+    def showPreview(self, value):
+        # Render a coarse blend within the latency target and stretch it to full size.
+        if self.preview is None or not self.preview.levels: return
+        frame = self.preview.render(value / float(self.steps))
+        self.blends[value].clear()
+        item = self.blends[value].addPixmap(QPixmap.fromImage(toQImage(frame)))
+        item.setScale(self.startImage.shape[1] / float(frame.shape[1]))
+
+    def showBlend(self, value, frame):
+        # Ignore frames from a worker that has since been replaced.
+        if self.sender() is not self.worker: return
+
+        # Display full-resolution blend as soon as it is ready.
+        self.ready.add(value)
+        self.blends[value].clear()
+        self.blends[value].addPixmap(QPixmap.fromImage(toQImage(frame)))
+        if value == self.sliAlpha.value(): self.changeAlpha()
+
+    def closeEvent(self, event):
+        self.stopBlending()
+        event.accept()
+
     def setStartPoint(self, event):
-        if self.state == 'IDLE': # Set initial point.
+        if event.button() == QtCore.Qt.RightButton: # Select confirmed pair.
+            self.selectPoint(self.gfxStart.mapToScene(event.pos()), self.startPoints)
+        elif self.state == 'SELECTED': # Move selected start point.
+            position = self.gfxStart.mapToScene(event.pos())
+            if self.startScene.itemsBoundingRect().contains(position):
+                self.moveSelectedPoint([position.x(), position.y()], self.endPoints[self.selected])
+        elif self.state == 'IDLE': # Set initial point.
             self.startPos = self.gfxStart.mapToScene(event.pos())
             if self.startScene.itemsBoundingRect().contains(self.startPos):
                 pen = QPen(QtCore.Qt.green)
@@ -205,7 +357,13 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
                 self.state = 'STARTSET'
 
     def setEndPoint(self, event):
-        if self.state == 'STARTSET': # Set final point.
+        if event.button() == QtCore.Qt.RightButton: # Select confirmed pair.
+            self.selectPoint(self.gfxEnd.mapToScene(event.pos()), self.endPoints)
+        elif self.state == 'SELECTED': # Move selected end point.
+            position = self.gfxEnd.mapToScene(event.pos())
+            if self.endScene.itemsBoundingRect().contains(position):
+                self.moveSelectedPoint(self.startPoints[self.selected], [position.x(), position.y()])
+        elif self.state == 'STARTSET': # Set final point.
             self.endPos = self.gfxEnd.mapToScene(event.pos())
             if self.endScene.itemsBoundingRect().contains(self.endPos):
                 pen = QPen(QtCore.Qt.green)
@@ -221,11 +379,95 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
             elif self.state == 'ENDSET': # Remove point from end scene.
                 self.endScene.removeItem(self.endScene.items()[0])
                 self.state = 'STARTSET'
+        elif event.key() == QtCore.Qt.Key_Delete and self.state == 'SELECTED': # Remove selected pair.
+            self.deleteSelectedPoint()
 
     def exitSelection(self, event):
         if self.state == 'ENDSET': # Confirm points and exit.
             self.confirmPoint()
             self.state = 'IDLE'
+        elif self.state == 'SELECTED': # Clear selection.
+            self.selected = None
+            self.state = 'IDLE'
+            self.drawPoints()
+
+    def selectPoint(self, position, points):
+        # Select the confirmed pair nearest the click, within twice the point radius.
+        if self.state not in ('IDLE', 'SELECTED') or points is None or points.shape[0] == 0: return
+        distances = np.hypot(points[:, 0] - position.x(), points[:, 1] - position.y())
+        index = int(np.argmin(distances))
+        self.selected = index if distances[index] <= self.radius * 2 else None
+        self.state = 'IDLE' if self.selected is None else 'SELECTED'
+        self.drawPoints()
+
+    def moveSelectedPoint(self, startPoint, endPoint):
+        # Replace the selected pair, keeping it selected for further moves.
+        index = self.selected
+        self.startPoints = np.array(self.startPoints, dtype = 'float64')
+        self.endPoints = np.array(self.endPoints, dtype = 'float64')
+        self.startPoints[index] = startPoint
+        self.endPoints[index] = endPoint
+        self.hasCustomPoints = True
+        startPoint, endPoint = self.startPoints[index].copy(), self.endPoints[index].copy()
+        self.editPoints(lambda blender: blender.movePoint(index, startPoint, endPoint))
+
+    def deleteSelectedPoint(self):
+        # Remove the selected pair.
+        index = self.selected
+        self.startPoints = np.delete(self.startPoints, index, axis = 0)
+        self.endPoints = np.delete(self.endPoints, index, axis = 0)
+        if index < self.presetCount: self.presetCount -= 1
+        self.hasPresetPoints = self.presetCount > 0
+        self.selected = None
+        self.state = 'IDLE'
+        if self.startPoints.shape[0] == 0:
+            self.startPoints = None
+            self.endPoints = None
+            self.hasPoints = False
+        self.editPoints(lambda blender: blender.deletePoint(index))
+
+    def editPoints(self, edit):
+        # Re-warp only the cached blend regions touched by the edit, in the background; too few points drop the blender.
+        if self.blender is not None:
+            if self.startPoints is not None and self.startPoints.shape[0] > 2:
+                blender = self.blender
+                startPoints, endPoints = self.startPoints, self.endPoints
+                def apply():
+                    edit(blender)
+                    self.updatePreview(startPoints, endPoints)
+                self.startBlending(apply)
+            else:
+                self.stopBlending()
+                self.blender = None
+                self.preview = None
+
+        # Rewrite point files, since existing records changed.
+        empty = np.empty((0, 2))
+        PointFile.create(self.startPointFile.path, self.startPoints if self.startPoints is not None else empty)
+        PointFile.create(self.endPointFile.path, self.endPoints if self.endPoints is not None else empty)
+
+        # Redraw points and triangulation.
+        self.drawPoints()
+        if self.chkTriangles.isChecked():
+            self.chkTriangles.setChecked(False)
+            self.chkTriangles.setChecked(True)
+
+    def drawPoints(self):
+        # Redraw confirmed points, highlighting the selected pair.
+        for scene in (self.startScene, self.endScene):
+            for item in scene.items():
+                if type(item) is QGraphicsEllipseItem:
+                    scene.removeItem(item)
+        if self.startPoints is None: return
+
+        for i in range(self.startPoints.shape[0]):
+            if i == self.selected: color = QtCore.Qt.yellow
+            elif i < self.presetCount: color = QtCore.Qt.red
+            else: color = QtCore.Qt.blue
+            pen = QPen(color)
+            brush = QBrush(color)
+            for scene, (x, y) in ((self.startScene, self.startPoints[i]), (self.endScene, self.endPoints[i])):
+                scene.addEllipse(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2, pen, brush)
 
     def confirmPoint(self):
         # Remove temporary points.
@@ -243,6 +485,17 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
         if self.hasPoints:
             self.startPoints = np.vstack((self.startPoints, [self.startPos.x(), self.startPos.y()]))
             self.endPoints = np.vstack((self.endPoints, [self.endPos.x(), self.endPos.y()]))
+
+            # Re-warp only the cached blend regions touched by the new point, in the background.
+            if self.blender is not None:
+                blender = self.blender
+                startPoint = [self.startPos.x(), self.startPos.y()]
+                endPoint = [self.endPos.x(), self.endPos.y()]
+                startPoints, endPoints = self.startPoints, self.endPoints
+                def edit():
+                    blender.addPoint(startPoint, endPoint)
+                    self.updatePreview(startPoints, endPoints)
+                self.startBlending(edit)
         else:
             self.startPoints = np.array([[self.startPos.x(), self.startPos.y()]])
             self.endPoints = np.array([[self.endPos.x(), self.endPos.y()]])
@@ -253,11 +506,9 @@ class MorphingApp(QMainWindow, Ui_MainWindow):
             self.chkTriangles.setChecked(False)
             self.chkTriangles.setChecked(True)
 
-        # Write confirmed points to files.
-        with open(self.startFile, 'w') as file:
-            file.writelines([str(int(np.round(coord[0]))) + ' ' + str(int(np.round(coord[1]))) + '\n' for coord in self.startPoints.tolist()])
-        with open(self.endFile, 'w') as file:
-            file.writelines([str(int(np.round(coord[0]))) + ' ' + str(int(np.round(coord[1]))) + '\n' for coord in self.endPoints.tolist()])
+        # Append confirmed points to files, keeping sub-pixel precision.
+        self.startPointFile.append([self.startPos.x(), self.startPos.y()])
+        self.endPointFile.append([self.endPos.x(), self.endPos.y()])
 
 if __name__ == "__main__":
     currentApp = QApplication(sys.argv)
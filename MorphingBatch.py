@@ -0,0 +1,167 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent import futures
+from Morphing import *
+from MorphingPoints import *
+
+defaultSettings = {'frames': 20,
+                   'fps': 5,
+                   'reverse': False,
+                   'formats': ['jpg', 'mp4'],
+                   'quality': None,
+                   'codec': None,
+                   'reverseMode': 'hardlink',
+                   'maps': None,
+                   'workers': 1}
+
+stampName = 'morph.json'
+
+def loadManifest(manifestPath):
+    # Read jobs and merge each one over the manifest defaults.
+    with open(manifestPath) as file:
+        manifest = json.load(file)
+    if isinstance(manifest, list): manifest = {'jobs': manifest}
+    defaults = dict(defaultSettings, **manifest.get('defaults', {}))
+    baseFolder = os.path.dirname(os.path.abspath(manifestPath))
+
+    jobs = []
+    for i, entry in enumerate(manifest['jobs']):
+        job = dict(defaults, **entry)
+        for field in ('start', 'end', 'output'):
+            if field not in job:
+                raise ValueError("job {} is missing '{}'.".format(i, field))
+            job[field] = os.path.join(baseFolder, job[field])
+        job.setdefault('name', os.path.basename(job['output']))
+        jobs.append(job)
+
+    return jobs
+
+def getSettings(job):
+    return {key: job[key] for key in sorted(defaultSettings) if key != 'workers'}
+
+def isUpToDate(job):
+    # Compare the stamp written by the last successful run against inputs and settings.
+    stampPath = os.path.join(job['output'], stampName)
+    if not os.path.isfile(stampPath):
+        return False
+    with open(stampPath) as file:
+        try:
+            stamp = json.load(file)
+        except ValueError:
+            return False
+    inputs = [job['start'], getPointSidecar(job['start']), job['end'], getPointSidecar(job['end'])]
+    if any(path is None or not os.path.isfile(path) for path in inputs):
+        return False
+
+    return stamp.get('settings') == getSettings(job) and max(os.path.getmtime(path) for path in inputs) <= os.path.getmtime(stampPath)
+
+def getSinks(job, ndim):
+    # Translate requested formats into frame sinks.
+    sinks = []
+    for format in job['formats']:
+        if format == 'mp4':
+            sinks.append(VideoSink(fps = job['fps'], codec = job['codec']))
+        elif format == 'npy':
+            sinks.append(ArraySink())
+        else:
+            sinks.append(ImageSequenceSink(format, job['quality'], 'L' if ndim == 2 else 'RGB', job['reverseMode']))
+
+    return sinks
+
+def runJob(job, force = False, cache = None):
+    result = {'name': job['name'], 'output': job['output'], 'status': 'done', 'seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        # Skip outputs that are newer than their inputs.
+        if not force and isUpToDate(job):
+            result['status'] = 'skipped'
+            return result
+
+        # Load image pair and correspondences.
+        startImage = openImage(job['start'])
+        endImage = openImage(job['end'])
+        startPoints = loadPoints(job['start'])
+        endPoints = loadPoints(job['end'])
+        if startPoints is None or endPoints is None:
+            raise ValueError("both images need a correspondence file.")
+
+        # Render sequence and record settings, profiling stages when requested.
+        profiler = Profiler() if job.get('profile') else None
+        blender = Blender(startImage, startPoints, endImage, endPoints, cache = cache, profiler = profiler)
+        if job['maps']: blender.precomputeMaps(job['maps'])
+        stats = blender.generateMorphVideo(job['output'], job['frames'], job['reverse'], job['workers'], job['reverseMode'], getSinks(job, startImage.ndim))
+        with open(os.path.join(job['output'], stampName), 'w') as file:
+            json.dump({'settings': getSettings(job), 'stats': stats}, file, indent = 2)
+        if profiler is not None: result['profile'] = profiler.getReport()
+    except Exception as error:
+        result['status'] = 'failed'
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        result['seconds'] = time.perf_counter() - start
+
+    return result
+
+def runJobs(jobs, concurrency = 1, force = False, onResult = None, cache = None):
+    # Validate concurrency input.
+    if concurrency < 1:
+        raise ValueError("concurrency must be a positive integer.")
+
+    # Schedule jobs with bounded concurrency, collecting results as they finish.
+    results = []
+    with futures.ProcessPoolExecutor(concurrency) as executor:
+        pending = {executor.submit(runJob, job, force, cache): job for job in jobs}
+        for future in futures.as_completed(pending):
+            try:
+                result = future.result()
+            except Exception as error:
+                job = pending[future]
+                result = {'name': job['name'], 'output': job['output'], 'status': 'failed', 'seconds': 0.0, 'error': '{}: {}'.format(type(error).__name__, error)}
+            results.append(result)
+            if onResult is not None: onResult(result)
+
+    return results
+
+def printResult(result):
+    print('{:8s} {:9.2f}s  {}{}'.format(result['status'], result['seconds'], result['name'], '  ' + result['error'] if result['error'] else ''))
+    sys.stdout.flush()
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Render morph sequences for many image pairs without the GUI.')
+    parser.add_argument('manifest', help = 'JSON manifest of jobs, optionally with shared defaults')
+    parser.add_argument('--jobs', type = int, default = os.cpu_count() or 1, help = 'number of jobs to run at once')
+    parser.add_argument('--force', action = 'store_true', help = 're-render outputs that are up to date')
+    parser.add_argument('--summary', help = 'write per-job results to this JSON file')
+    parser.add_argument('--profile', action = 'store_true', help = 'record per-stage timings in the summary')
+    parser.add_argument('--cache', help = 'folder of rendered frames shared between jobs and runs')
+    parser.add_argument('--cache-size', type = int, default = 1024, help = 'disk budget of the frame cache in megabytes')
+    options = parser.parse_args(arguments)
+
+    # Share frames between jobs that render the same pair at overlapping alphas; frames go straight to disk, where every job process sees them.
+    cache = FrameCache(memoryBudget = 0, diskBudget = options.cache_size * 2 ** 20, diskPath = options.cache) if options.cache else None
+
+    # Run all jobs, continuing past failures.
+    jobs = loadManifest(options.manifest)
+    if options.profile:
+        for job in jobs: job['profile'] = True
+    start = time.perf_counter()
+    results = runJobs(jobs, options.jobs, options.force, printResult, cache)
+    elapsed = time.perf_counter() - start
+
+    # Summarize timings.
+    counts = {status: sum(result['status'] == status for result in results) for status in ('done', 'skipped', 'failed')}
+    print('{done} done, {skipped} skipped, {failed} failed'.format(**counts) + ' in {:.2f}s'.format(elapsed))
+    if options.summary:
+        with open(options.summary, 'w') as file:
+            json.dump({'seconds': elapsed, 'counts': counts, 'results': results}, file, indent = 2)
+
+    return 1 if counts['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import imageio
+import numpy as np
+from PIL import Image
+from scipy import spatial
+from Morphing import *
+
+fixturePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests')
+
+def loadFixture(name, scale, pointCount):
+    # Load image and correspondences.
+    image = imageio.imread(os.path.join(fixturePath, name))
+    points = np.loadtxt(os.path.join(fixturePath, name + '.txt'))[:pointCount]
+
+    # Upscale image and correspondences together.
+    if scale != 1:
+        size = (int(round(image.shape[1] * scale)), int(round(image.shape[0] * scale)))
+        points = points * [(size[0] - 1) / (image.shape[1] - 1), (size[1] - 1) / (image.shape[0] - 1)]
+        image = np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+    return image, points
+
+def measure(function, repeat):
+    # Keep the best wall time, then trace one extra call for peak memory.
+    seconds = min(timeCall(function) for _ in range(repeat))
+    tracemalloc.start()
+    function()
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return seconds, peakMemory
+
+def timeCall(function):
+    start = time.perf_counter()
+    function()
+
+    return time.perf_counter() - start
+
+def timeStages(stages):
+    # Run named stages in order, timing each one.
+    times = {}
+    for name, function in stages:
+        times[name] = timeCall(function)
+
+    return times
+
+def benchmarkAffine(affineType, startImage, startPoints, endPoints, repeat):
+    # Transform every triangle of the halfway mesh.
+    simplices = spatial.Delaunay(startPoints).simplices
+    targets = 0.5 * startPoints + 0.5 * endPoints
+    destination = np.zeros(startImage.shape, dtype = 'float64')
+    coordinates = CoordinateBuffer()
+    affines = []
+
+    def construct():
+        affines[:] = [affineType(startPoints[triangle], targets[triangle]) for triangle in simplices.tolist()]
+
+    def transform():
+        for affine in affines:
+            affine.transform(startImage, destination, coordinates)
+
+    construct()
+    seconds, peakMemory = measure(transform, repeat)
+    stages = timeStages([('construct', construct), ('transform', transform)])
+
+    return seconds, peakMemory, stages
+
+def benchmarkBlender(blenderType, startImage, startPoints, endImage, endPoints, repeat):
+    blender = blenderType(startImage, startPoints, endImage, endPoints)
+    seconds, peakMemory = measure(lambda: blender.getBlendedImage(0.5), repeat)
+
+    # Break one frame down into the engine stages.
+    state = {}
+    target1, target2 = blender.getBuffers()
+    output = np.empty(startImage.shape, dtype = startImage.dtype)
+    targets = 0.5 * startPoints + 0.5 * endPoints
+    stages = timeStages([
+        ('construct', lambda: blenderType(startImage, startPoints, endImage, endPoints)),
+        ('rasterize', lambda: state.update(indexMap = blender.engine.rasterize(targets[blender.simplices]))),
+        ('invert', lambda: state.update(targetInverse = blender.engine.getTargetInverse(blender.startGeometry, blender.endGeometry, 0.5))),
+        ('warpStart', lambda: blender.engine.warp(startImage, blender.startGeometry, state['targetInverse'], state['indexMap'], target1)),
+        ('warpEnd', lambda: blender.engine.warp(endImage, blender.endGeometry, state['targetInverse'], state['indexMap'], target2)),
+        ('composite', lambda: blender.composite(0.5, target1, target2, output))])
+
+    return seconds, peakMemory, stages
+
+def benchmarkSequence(blenderType, startImage, startPoints, endImage, endPoints, frameCount, repeat):
+    # Render a full sequence without writing any output.
+    blender = blenderType(startImage, startPoints, endImage, endPoints)
+    alphas = np.linspace(0, 1, frameCount)[1:-1].tolist()
+    seconds, peakMemory = measure(lambda: [None for _ in blender.iterBlendedFrames(alphas)], repeat)
+
+    return seconds, peakMemory, {}
+
+def runSuite(scales, pointCounts, frameCounts, repeat):
+    results = []
+    for scale in scales:
+        for pointCount in pointCounts:
+            # Load fixtures at this size.
+            startImage, startPoints = loadFixture('tiger.jpg', scale, pointCount)
+            endImage, endPoints = loadFixture('wolf.jpg', scale, pointCount)
+            grayStart = np.ascontiguousarray(startImage[..., 0])
+            grayEnd = np.ascontiguousarray(endImage[..., 0])
+            megapixels = startImage.shape[0] * startImage.shape[1] / 1e6
+
+            # Define cases covering single frames and sequences.
+            cases = [('Affine.transform', 1, lambda: benchmarkAffine(Affine, grayStart, startPoints, endPoints, repeat)),
+                     ('ColorAffine.transform', 1, lambda: benchmarkAffine(ColorAffine, startImage, startPoints, endPoints, repeat)),
+                     ('Blender.getBlendedImage', 1, lambda: benchmarkBlender(Blender, grayStart, startPoints, grayEnd, endPoints, repeat)),
+                     ('ColorBlender.getBlendedImage', 1, lambda: benchmarkBlender(ColorBlender, startImage, startPoints, endImage, endPoints, repeat))]
+            for frameCount in frameCounts:
+                cases.append(('ColorBlender.iterBlendedFrames', frameCount - 2,
+                              lambda frameCount = frameCount: benchmarkSequence(ColorBlender, startImage, startPoints, endImage, endPoints, frameCount, repeat)))
+
+            for name, frames, case in cases:
+                seconds, peakMemory, stages = case()
+                results.append({'case': name,
+                                'scale': scale,
+                                'width': startImage.shape[1],
+                                'height': startImage.shape[0],
+                                'points': len(startPoints),
+                                'frames': frames,
+                                'seconds': seconds,
+                                'megapixelsPerSecond': megapixels * frames / seconds,
+                                'framesPerSecond': frames / seconds,
+                                'peakMemory': peakMemory,
+                                'stages': stages})
+                print('{:32s} {:5.2f}x {:4d}pts {:3d}fr {:9.4f}s {:8.2f}MP/s {:7.1f}MB'.format(
+                    name, scale, len(startPoints), frames, seconds, megapixels * frames / seconds, peakMemory / 2 ** 20))
+
+    return results
+
+def getKey(result):
+    return (result['case'], result['scale'], result['points'], result['frames'])
+
+def compareBaseline(results, baseline, tolerance):
+    # Find cases that slowed down beyond the tolerance.
+    previous = {getKey(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        if getKey(result) in previous and result['seconds'] > previous[getKey(result)]['seconds'] * (1 + tolerance):
+            regressions.append((result, previous[getKey(result)]))
+
+    return regressions
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the Morphing module on the tests/ fixtures.')
+    parser.add_argument('--scales', type = float, nargs = '+', default = [0.5, 1.0, 2.0])
+    parser.add_argument('--points', type = int, nargs = '+', default = [25, 99])
+    parser.add_argument('--frames', type = int, nargs = '+', default = [5, 20])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--output', help = 'write results to this JSON file')
+    parser.add_argument('--baseline', help = 'compare against a previous JSON file')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'allowed slowdown relative to the baseline')
+    options = parser.parse_args(arguments)
+
+    # Run suite.
+    results = runSuite(options.scales, options.points, options.frames, options.repeat)
+    report = {'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.machine(),
+              'processor': platform.processor(),
+              'results': results}
+
+    # Save machine-readable results.
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent = 2)
+
+    # Check for regressions.
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressions = compareBaseline(results, json.load(file), options.tolerance)
+        for result, previous in regressions:
+            print('REGRESSION {} {}x {}pts {}fr: {:.4f}s -> {:.4f}s'.format(
+                result['case'], result['scale'], result['points'], result['frames'], previous['seconds'], result['seconds']))
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
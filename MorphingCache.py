@@ -0,0 +1,135 @@
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+from MorphingTiles import *
+
+def hashArrays(*arrays):
+    # Digest array contents together with their shapes and dtypes.
+    digest = hashlib.sha1()
+    for array in arrays:
+        # Hash tiled images through their memory-mapped tiles, one page at a time.
+        if isinstance(array, TiledImage): array = array.tiles
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.data)
+
+    return digest.hexdigest()
+
+class FrameCache:
+    def __init__(self, memoryBudget = 256 * 2 ** 20, diskBudget = 0, diskPath = None):
+        # Validate budget inputs.
+        if memoryBudget < 0 or diskBudget < 0:
+            raise ValueError("budgets must be non-negative.")
+        if diskBudget > 0 and diskPath is None:
+            raise ValueError("diskPath is required when diskBudget is positive.")
+
+        # Initialize cache data.
+        self.memoryBudget = memoryBudget
+        self.diskBudget = diskBudget
+        self.diskPath = diskPath
+        self.initialize()
+        if diskPath is not None and not os.path.exists(diskPath): os.makedirs(diskPath)
+
+    def initialize(self):
+        # Reset in-memory state.
+        self.frames = collections.OrderedDict()
+        self.memoryUsed = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Share only the configuration and the disk tier with worker processes.
+        return {'memoryBudget': self.memoryBudget, 'diskBudget': self.diskBudget, 'diskPath': self.diskPath}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.initialize()
+
+    def getKey(self, pairKey, alpha, shape):
+        return '{}-{:.12g}-{}'.format(pairKey, alpha, 'x'.join(str(size) for size in shape))
+
+    def getPath(self, key):
+        return os.path.join(self.diskPath, key + '.npy')
+
+    def get(self, key):
+        with self.lock:
+            # Look up memory tier, marking the frame as recently used.
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+
+            # Fall back to disk tier, promoting frames that fit the memory budget.
+            if self.diskBudget > 0 and os.path.isfile(self.getPath(key)):
+                try:
+                    frame = np.load(self.getPath(key), mmap_mode = 'r')
+                    os.utime(self.getPath(key))
+                except (OSError, ValueError):
+                    frame = None
+                if frame is not None:
+                    self.diskHits += 1
+                    if frame.nbytes <= self.memoryBudget:
+                        frame = np.array(frame)
+                        self.store(key, frame)
+                    return frame
+
+            self.misses += 1
+            return None
+
+    def put(self, key, frame):
+        with self.lock:
+            if key in self.frames: return
+
+            # Spill frames larger than the memory budget straight to disk, without copying them.
+            if frame.nbytes > self.memoryBudget:
+                if self.diskBudget >= frame.nbytes: self.spill(key, frame)
+                return
+            self.store(key, np.array(frame))
+
+    def store(self, key, frame):
+        # Add frame to memory tier, spilling least recently used frames to disk.
+        self.frames[key] = frame
+        self.memoryUsed += frame.nbytes
+        while self.memoryUsed > self.memoryBudget and self.frames:
+            evictedKey, evicted = self.frames.popitem(last = False)
+            self.memoryUsed -= evicted.nbytes
+            if self.diskBudget >= evicted.nbytes: self.spill(evictedKey, evicted)
+
+    def spill(self, key, frame):
+        # Write frame atomically so concurrent processes never read partial files.
+        if not os.path.isfile(self.getPath(key)):
+            handle, path = tempfile.mkstemp(dir = self.diskPath, suffix = '.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                np.save(file, frame)
+            os.replace(path, self.getPath(key))
+
+        # Delete least recently used files beyond the disk budget.
+        entries = []
+        for name in os.listdir(self.diskPath):
+            if not name.endswith('.npy'): continue
+            try:
+                entries.append((os.path.join(self.diskPath, name), os.stat(os.path.join(self.diskPath, name))))
+            except OSError:
+                pass
+        entries.sort(key = lambda entry: entry[1].st_mtime)
+        used = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if used <= self.diskBudget: break
+            used -= stat.st_size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def getStats(self):
+        return {'frames': len(self.frames),
+                'memoryUsed': self.memoryUsed,
+                'hits': self.hits,
+                'diskHits': self.diskHits,
+                'misses': self.misses}
@@ -0,0 +1,246 @@
+#! /usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+import traceback
+import numpy as np
+from concurrent import futures
+from PIL import Image
+from scipy import ndimage, spatial
+from MorphingBatch import loadManifest, printResult
+from MorphingPoints import *
+from MorphingPreview import downsample
+from MorphingSinks import toUint8
+from MorphingTiles import *
+
+def toGray(image, maximumSize = 512):
+    # Halve large images band by band first, so memory-mapped and tiled inputs are never fully loaded.
+    scale = 1.0
+    while max(image.shape[:2]) >= 2 * maximumSize:
+        image = downsample(image)
+        scale /= 2
+
+    # Convert to a grayscale working image no larger than maximumSize, returning its scale.
+    gray = Image.fromarray(toUint8(np.asarray(image))).convert('L')
+    factor = min(1.0, maximumSize / float(max(gray.size)))
+    if factor < 1: gray = gray.resize((max(int(round(gray.size[0] * factor)), 1), max(int(round(gray.size[1] * factor)), 1)), Image.BILINEAR)
+    scale *= factor
+
+    return np.asarray(gray, dtype = 'float32') / 255, scale
+
+def detectCorners(gray, count = 400, sigma = 1.5, spacing = 6, margin = 8):
+    # Define Harris response from the smoothed structure tensor.
+    dy = ndimage.sobel(gray, 0)
+    dx = ndimage.sobel(gray, 1)
+    xx = ndimage.gaussian_filter(dx * dx, sigma)
+    yy = ndimage.gaussian_filter(dy * dy, sigma)
+    xy = ndimage.gaussian_filter(dx * dy, sigma)
+    response = xx * yy - xy * xy - 0.04 * (xx + yy) ** 2
+
+    # Keep strongest local maxima, at least spacing pixels apart and clear of the border.
+    peaks = (response == ndimage.maximum_filter(response, size = 2 * spacing + 1)) & (response > 0.01 * response.max())
+    peaks[:margin] = peaks[-margin:] = False
+    peaks[:, :margin] = peaks[:, -margin:] = False
+    rows, cols = np.nonzero(peaks)
+    order = np.argsort(response[rows, cols])[::-1][:count]
+    rows, cols = rows[order], cols[order]
+
+    # Refine peaks to sub-pixel positions with a parabola through each axis.
+    def refine(before, centre, after):
+        curvature = before - 2 * centre + after
+        return np.clip(np.divide(before - after, 2 * curvature, out = np.zeros(centre.shape), where = curvature < 0), -0.5, 0.5)
+    centre = response[rows, cols]
+
+    return np.stack([cols + refine(response[rows, cols - 1], centre, response[rows, cols + 1]), rows + refine(response[rows - 1, cols], centre, response[rows + 1, cols])], axis = 1)
+
+def describeCorners(gray, corners, radius = 8, step = 2):
+    # Sample a normalized patch around every corner from a slightly blurred image.
+    blurred = ndimage.gaussian_filter(gray, step / 2.0)
+    offsets = np.arange(-radius, radius + 1, step)
+    centres = np.rint(corners).astype('intp')
+    rows = np.clip(centres[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis], 0, gray.shape[0] - 1)
+    cols = np.clip(centres[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :], 0, gray.shape[1] - 1)
+    patches = blurred[rows, cols].reshape(corners.shape[0], -1)
+
+    # Remove brightness and contrast so patches compare by shape.
+    patches -= patches.mean(axis = 1, keepdims = True)
+    patches /= np.linalg.norm(patches, axis = 1, keepdims = True) + 1e-6
+
+    return patches
+
+def matchDescriptors(startDescriptors, endDescriptors, ratio = 0.8, startCorners = None, endCorners = None, radius = None):
+    # Validate descriptor counts.
+    if startDescriptors.shape[0] < 1 or endDescriptors.shape[0] < 2:
+        return np.empty(0, dtype = 'intp'), np.empty(0, dtype = 'intp')
+
+    # Search only corners within radius of each other when positions are given.
+    if radius is not None:
+        return matchNearby(startDescriptors, endDescriptors, ratio, startCorners, endCorners, radius)
+
+    # Find the two nearest end descriptors, keeping distinctive matches.
+    distances, indices = spatial.cKDTree(endDescriptors).query(startDescriptors, k = 2)
+    keep = distances[:, 0] < ratio * distances[:, 1]
+
+    # Keep only matches that agree in both directions.
+    _, reverse = spatial.cKDTree(startDescriptors).query(endDescriptors, k = 1)
+    keep &= reverse[indices[:, 0]] == np.arange(startDescriptors.shape[0])
+
+    return np.flatnonzero(keep), indices[keep, 0]
+
+def matchNearby(startDescriptors, endDescriptors, ratio, startCorners, endCorners, radius):
+    # Pair corners lying within radius of each other, scoring each pair by descriptor distance.
+    pairs = spatial.cKDTree(startCorners).sparse_distance_matrix(spatial.cKDTree(endCorners), radius, output_type = 'ndarray')
+    if pairs.shape[0] == 0:
+        return np.empty(0, dtype = 'intp'), np.empty(0, dtype = 'intp')
+    starts, ends = pairs['i'].astype('intp'), pairs['j'].astype('intp')
+    distances = np.linalg.norm(startDescriptors[starts] - endDescriptors[ends], axis = 1)
+
+    # Find the two nearest end descriptors of every start corner, keeping distinctive matches; a lone candidate is kept.
+    order = np.lexsort((distances, starts))
+    starts, ends, distances = starts[order], ends[order], distances[order]
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    second = np.minimum(first + 1, starts.shape[0] - 1)
+    keep = (starts[second] != starts[first]) | (second == first) | (distances[first] < ratio * distances[second])
+
+    # Keep only matches that agree in both directions.
+    order = np.lexsort((distances, ends))
+    nearest = order[np.r_[True, ends[order][1:] != ends[order][:-1]]]
+    reverse = np.full(endDescriptors.shape[0], -1, dtype = 'intp')
+    reverse[ends[nearest]] = starts[nearest]
+    keep &= reverse[ends[first]] == starts[first]
+
+    return starts[first[keep]], ends[first[keep]]
+
+def rejectOutliers(startPoints, endPoints, threshold, iterations = 256, seed = 0):
+    # Validate match count; too few matches cannot vote.
+    count = startPoints.shape[0]
+    if count < 4:
+        return np.ones(count, dtype = bool)
+
+    # Fit affine transforms to random triples of matches, all at once.
+    source = np.hstack([startPoints, np.ones((count, 1))])
+    samples = np.random.RandomState(seed).randint(0, count, (iterations, 3))
+    systems = source[samples]
+    valid = np.abs(np.linalg.det(systems)) > 1e-6
+    if not np.any(valid):
+        return np.ones(count, dtype = bool)
+    transforms = np.linalg.solve(systems[valid], endPoints[samples[valid]])
+
+    # Keep the consensus of the best transform, refined by least squares.
+    errors = np.linalg.norm(np.matmul(source, transforms) - endPoints, axis = 2)
+    inliers = errors[np.argmax(np.sum(errors < threshold, axis = 1))] < threshold
+    if np.sum(inliers) >= 3:
+        transform = np.linalg.lstsq(source[inliers], endPoints[inliers], rcond = None)[0]
+        inliers = np.linalg.norm(np.matmul(source, transform) - endPoints, axis = 1) < threshold
+
+    return inliers
+
+def rejectLocalOutliers(startPoints, endPoints, threshold, neighbours = 12):
+    # Keep matches that agree with the affine motion of their nearest neighbours, so differently moving regions each keep their matches.
+    count = startPoints.shape[0]
+    if count <= neighbours:
+        return rejectOutliers(startPoints, endPoints, threshold)
+    _, nearest = spatial.cKDTree(startPoints).query(startPoints, k = neighbours)
+
+    return np.array([rejectOutliers(startPoints[indices], endPoints[indices], threshold)[0] for indices in nearest], dtype = bool)
+
+def getAnchors(shape, divisions = 2):
+    # Place points evenly along the image border, including all four corners.
+    height, width = shape[:2]
+    xs = np.linspace(0, width - 1, divisions + 1)
+    ys = np.linspace(0, height - 1, divisions + 1)
+    anchors = [(x, y) for x in xs for y in (ys[0], ys[-1])] + [(x, y) for x in (xs[0], xs[-1]) for y in ys[1:-1]]
+
+    return np.array(anchors, dtype = 'float64')
+
+def findCorrespondences(startImage, endImage, count = 400, ratio = 0.8, threshold = 0.05, maximumSize = 512, divisions = 2, radius = 0.1, neighbours = 12):
+    # Validate image shapes.
+    if startImage.shape != endImage.shape:
+        raise ValueError("startImage and endImage must have the same shape.")
+
+    # Detect and describe corners on downscaled grayscale copies.
+    startGray, scale = toGray(startImage, maximumSize)
+    endGray, _ = toGray(endImage, maximumSize)
+    startCorners = detectCorners(startGray, count)
+    endCorners = detectCorners(endGray, count)
+    diagonal = np.hypot(*startGray.shape)
+    startMatches, endMatches = matchDescriptors(describeCorners(startGray, startCorners), describeCorners(endGray, endCorners), ratio, startCorners, endCorners, radius * diagonal)
+    startPoints = startCorners[startMatches]
+    endPoints = endCorners[endMatches]
+
+    # Reject matches that disagree with the affine motion of their neighbourhood.
+    inliers = rejectLocalOutliers(startPoints, endPoints, threshold * diagonal, neighbours)
+    startPoints, endPoints = startPoints[inliers], endPoints[inliers]
+
+    # Map pixel centres back to full resolution and anchor the image border.
+    limits = [startImage.shape[1] - 1, startImage.shape[0] - 1]
+    startPoints = np.clip((startPoints + 0.5) / scale - 0.5, 0, limits)
+    endPoints = np.clip((endPoints + 0.5) / scale - 0.5, 0, limits)
+    anchors = getAnchors(startImage.shape, divisions)
+
+    return np.vstack([startPoints, anchors]), np.vstack([endPoints, anchors])
+
+def writeCorrespondences(startPath, endPath, startPoints, endPoints):
+    # Write the point files read by the application and the batch runner.
+    PointFile.create(getPointPath(startPath), startPoints)
+    PointFile.create(getPointPath(endPath), endPoints)
+
+def matchJob(job, force = False, **options):
+    result = {'name': job['name'], 'output': job['output'], 'status': 'done', 'seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        # Keep existing correspondences unless asked to replace them.
+        if not force and getPointSidecar(job['start']) is not None and getPointSidecar(job['end']) is not None:
+            result['status'] = 'skipped'
+            return result
+
+        # Match image pair and write both point files.
+        startPoints, endPoints = findCorrespondences(openImage(job['start']), openImage(job['end']), **options)
+        writeCorrespondences(job['start'], job['end'], startPoints, endPoints)
+        result['points'] = startPoints.shape[0]
+    except Exception as error:
+        result['status'] = 'failed'
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        result['seconds'] = time.perf_counter() - start
+
+    return result
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = 'Generate correspondences for the image pairs of a batch manifest.')
+    parser.add_argument('manifest', help = 'JSON manifest of jobs, as read by MorphingBatch.py')
+    parser.add_argument('--jobs', type = int, default = os.cpu_count() or 1, help = 'number of pairs to match at once')
+    parser.add_argument('--force', action = 'store_true', help = 'replace existing correspondence files')
+    parser.add_argument('--features', type = int, default = 400, help = 'corners detected per image')
+    parser.add_argument('--ratio', type = float, default = 0.8, help = 'nearest neighbour distance ratio for accepting a match')
+    parser.add_argument('--threshold', type = float, default = 0.05, help = 'outlier distance as a fraction of the image diagonal')
+    parser.add_argument('--radius', type = float, default = 0.1, help = 'farthest match as a fraction of the image diagonal')
+    parser.add_argument('--size', type = int, default = 512, help = 'longest side of the working images')
+    options = parser.parse_args(arguments)
+
+    # Validate jobs input.
+    if options.jobs < 1:
+        raise ValueError("jobs must be a positive integer.")
+
+    # Match all pairs, continuing past failures.
+    jobs = loadManifest(options.manifest)
+    settings = {'count': options.features, 'ratio': options.ratio, 'threshold': options.threshold, 'maximumSize': options.size, 'radius': options.radius}
+    start = time.perf_counter()
+    results = []
+    with futures.ProcessPoolExecutor(options.jobs) as executor:
+        for future in futures.as_completed([executor.submit(matchJob, job, options.force, **settings) for job in jobs]):
+            results.append(future.result())
+            printResult(results[-1])
+    elapsed = time.perf_counter() - start
+
+    # Summarize timings.
+    counts = {status: sum(result['status'] == status for result in results) for status in ('done', 'skipped', 'failed')}
+    print('{done} done, {skipped} skipped, {failed} failed'.format(**counts) + ' in {:.2f}s'.format(elapsed))
+
+    return 1 if counts['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
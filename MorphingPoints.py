@@ -0,0 +1,106 @@
+import io
+import os
+import struct
+import zlib
+import numpy as np
+
+# Header: magic, version, reserved, point count, CRC-32 of the point data.
+headerFormat = '<4sHHII'
+headerSize = struct.calcsize(headerFormat)
+magic = b'MPTS'
+version = 1
+pointDtype = np.dtype('<f4')
+
+class PointFile:
+    def __init__(self, path):
+        # Initialize point file data; nothing is read until needed.
+        self.path = path
+        self.header = None
+
+    @staticmethod
+    def create(path, points):
+        # Validate points input.
+        points = np.ascontiguousarray(np.reshape(points, (-1, 2)), dtype = pointDtype)
+
+        # Write header and points, replacing any existing file atomically.
+        data = points.tobytes()
+        temporaryPath = path + '.tmp'
+        with open(temporaryPath, 'wb') as file:
+            file.write(struct.pack(headerFormat, magic, version, 0, points.shape[0], zlib.crc32(data) & 0xffffffff))
+            file.write(data)
+        os.replace(temporaryPath, path)
+
+        return PointFile(path)
+
+    def readHeader(self):
+        # Read and validate the fixed-size header.
+        with open(self.path, 'rb') as file:
+            header = file.read(headerSize)
+        if len(header) != headerSize:
+            raise ValueError("{} is not a point file.".format(self.path))
+        fileMagic, fileVersion, _, count, checksum = struct.unpack(headerFormat, header)
+        if fileMagic != magic or fileVersion != version:
+            raise ValueError("{} is not a version {} point file.".format(self.path, version))
+        if os.path.getsize(self.path) < headerSize + count * 2 * pointDtype.itemsize:
+            raise ValueError("{} is truncated.".format(self.path))
+        self.header = (count, checksum)
+
+        return self.header
+
+    def getCount(self):
+        return self.readHeader()[0]
+
+    def load(self, validate = True):
+        # Map point data lazily; only the header and checksum are read eagerly.
+        count, checksum = self.readHeader()
+        if count == 0:
+            return np.empty((0, 2), dtype = 'float64')
+        points = np.memmap(self.path, dtype = pointDtype, mode = 'r', offset = headerSize, shape = (count, 2))
+
+        # Validate checksum.
+        if validate and zlib.crc32(points.tobytes()) & 0xffffffff != checksum:
+            raise ValueError("{} failed its checksum.".format(self.path))
+
+        return points.astype('float64')
+
+    def append(self, point):
+        # Append one point and update the header in place, without rewriting existing points.
+        count, checksum = self.readHeader()
+        data = np.asarray(point, dtype = pointDtype).reshape(2).tobytes()
+        with open(self.path, 'r+b') as file:
+            file.seek(headerSize + count * len(data))
+            file.write(data)
+            file.truncate()
+            file.seek(0)
+            file.write(struct.pack(headerFormat, magic, version, 0, count + 1, zlib.crc32(data, checksum) & 0xffffffff))
+        self.header = (count + 1, zlib.crc32(data, checksum) & 0xffffffff)
+
+def getPointPath(imagePath):
+    return imagePath + '.pts'
+
+def getPointSidecar(imagePath):
+    # Prefer the binary sidecar unless the text file was edited after it.
+    binaryPath, textPath = getPointPath(imagePath), imagePath + '.txt'
+    if os.path.isfile(binaryPath) and (not os.path.isfile(textPath) or os.path.getmtime(binaryPath) >= os.path.getmtime(textPath)):
+        return binaryPath
+    if os.path.isfile(textPath):
+        return textPath
+
+    return None
+
+def loadPoints(imagePath, convert = True):
+    # Read correspondences for an image, or None when it has no sidecar.
+    path = getPointSidecar(imagePath)
+    if path is None:
+        return None
+    if path.endswith('.pts'):
+        return PointFile(path).load()
+
+    # Read legacy text sidecar and convert it to the binary format.
+    with open(path) as file:
+        text = file.read()
+    points = np.loadtxt(io.StringIO(text), ndmin = 2).reshape(-1, 2) if text.strip() else np.empty((0, 2))
+    if convert:
+        PointFile.create(getPointPath(imagePath), points)
+
+    return points
@@ -0,0 +1,91 @@
+import collections
+import time
+import numpy as np
+from Morphing import *
+
+def downsample(image, bandHeight = 512):
+    # Average 2x2 pixel blocks, dropping an odd trailing row or column.
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    result = np.empty((height // 2, width // 2) + image.shape[2:], dtype = image.dtype)
+
+    # Read one band of rows at a time so memory-mapped and tiled images are never fully loaded.
+    for top in range(0, height, bandHeight):
+        blocks = np.asarray(image[top:min(top + bandHeight, height), :width]).astype('float32')
+        blocks = (blocks[0::2, 0::2] + blocks[1::2, 0::2] + blocks[0::2, 1::2] + blocks[1::2, 1::2]) / 4
+        result[top // 2:top // 2 + blocks.shape[0]] = np.rint(blocks) if np.issubdtype(image.dtype, np.integer) else blocks
+
+    return result
+
+def downsamplePoints(points, shape):
+    # Map pixel centres to the half-resolution grid, keeping points inside the image.
+    points = (np.asarray(points, dtype = 'float64') + 0.5) / 2 - 0.5
+
+    return np.clip(points, 0, [shape[1] - 1, shape[0] - 1])
+
+levelCache = collections.OrderedDict()
+
+def getPreviewLevels(startImage, endImage, minimumSize = 64, cacheSize = 4):
+    # Key levels by image content only, so point edits never downsample again.
+    key = (hashArrays(startImage, endImage), minimumSize)
+    levels = levelCache.get(key)
+    if levels is not None:
+        levelCache.move_to_end(key)
+        return levels
+
+    # Halve both images until the smallest side reaches minimumSize.
+    levels = []
+    startLevel, endLevel = startImage, endImage
+    while min(startLevel.shape[:2]) // 2 >= minimumSize:
+        startLevel, endLevel = downsample(startLevel), downsample(endLevel)
+        levels.append((startLevel, endLevel))
+
+    # Store levels and evict the least recently used image pairs.
+    levelCache[key] = levels
+    while len(levelCache) > cacheSize:
+        levelCache.popitem(last = False)
+
+    return levels
+
+class PreviewPyramid:
+    def __init__(self, startImage, startPoints, endImage, endPoints, minimumSize = 64):
+        # Validate minimumSize input.
+        if minimumSize < 8:
+            raise ValueError("minimumSize must be at least 8 pixels.")
+
+        # Build a blender per cached level from correspondences scaled to it.
+        self.levels = []
+        self.timings = []
+        for startLevel, endLevel in getPreviewLevels(startImage, endImage, minimumSize):
+            startPoints = downsamplePoints(startPoints, startLevel.shape)
+            endPoints = downsamplePoints(endPoints, endLevel.shape)
+            self.levels.append(Blender(startLevel, startPoints, endLevel, endPoints))
+            self.timings.append(None)
+
+    def getLevel(self, latency):
+        # Estimate render times from measured levels, scaling by pixel count.
+        measured = [(i, seconds) for i, seconds in enumerate(self.timings) if seconds is not None]
+        if not measured:
+            return len(self.levels) - 1
+        reference, seconds = measured[-1]
+        pixels = self.levels[reference].startImage.shape[0] * self.levels[reference].startImage.shape[1]
+
+        # Pick the finest level expected to meet the latency target.
+        for i, blender in enumerate(self.levels):
+            estimate = self.timings[i] if self.timings[i] is not None else seconds * blender.startImage.shape[0] * blender.startImage.shape[1] / pixels
+            if estimate <= latency:
+                return i
+
+        return len(self.levels) - 1
+
+    def render(self, alpha, latency = 0.03):
+        # Validate pyramid depth.
+        if not self.levels:
+            raise ValueError("images are too small for a preview pyramid.")
+
+        # Render at the finest level within the latency target.
+        level = self.getLevel(latency)
+        start = time.perf_counter()
+        frame = self.levels[level].getBlendedImage(alpha)
+        self.timings[level] = time.perf_counter() - start
+
+        return frame
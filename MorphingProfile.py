@@ -0,0 +1,107 @@
+import threading
+import time
+import tracemalloc
+
+# Peaks cannot be reset before Python 3.9, so stages then report the peak since tracing started.
+resetPeak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+class Stage:
+    def __init__(self, profiler, name, pixels):
+        # Initialize stage data; pixels may be filled in once the work is known.
+        self.profiler = profiler
+        self.name = name
+        self.pixels = pixels
+
+    def __enter__(self):
+        self.profiler.enter()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        seconds = time.perf_counter() - self.start
+        self.profiler.record(self.name, seconds, self.pixels, self.profiler.exit())
+
+class NullStage:
+    # Shared by every disabled stage; attribute writes are accepted and ignored.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+class NullProfiler:
+    def __init__(self):
+        self.stageContext = NullStage()
+
+    def stage(self, name, pixels = 0):
+        return self.stageContext
+
+    def record(self, name, seconds, pixels = 0, peakBytes = 0, calls = 1):
+        pass
+
+nullProfiler = NullProfiler()
+
+class Profiler:
+    def __init__(self, onStage = None, traceMemory = False):
+        # Initialize profiler data.
+        self.onStage = onStage
+        self.traceMemory = traceMemory
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.tracing = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+
+    def stage(self, name, pixels = 0):
+        return Stage(self, name, pixels)
+
+    def enter(self):
+        # Track peak allocations per nested stage on this thread.
+        if not self.traceMemory: return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        stack = self.local.__dict__.setdefault('stack', [])
+        current, peak = tracemalloc.get_traced_memory()
+        for entry in stack:
+            entry[1] = max(entry[1], peak)
+        resetPeak()
+        stack.append([current, current])
+
+    def exit(self):
+        # Fold this stage's peak into enclosing stages.
+        if not self.traceMemory: return 0
+        stack = self.local.stack
+        current, peak = tracemalloc.get_traced_memory()
+        start, stagePeak = stack.pop()
+        stagePeak = max(stagePeak, peak)
+        for entry in stack:
+            entry[1] = max(entry[1], stagePeak)
+        resetPeak()
+
+        return stagePeak - start
+
+    def record(self, name, seconds, pixels = 0, peakBytes = 0, calls = 1):
+        # Accumulate stage totals.
+        with self.lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'pixels': 0, 'peakBytes': 0})
+            stage['calls'] += calls
+            stage['seconds'] += seconds
+            stage['pixels'] += int(pixels)
+            stage['peakBytes'] = max(stage['peakBytes'], int(peakBytes))
+
+        # Report stage to the caller's metrics hook.
+        if self.onStage is not None:
+            self.onStage({'stage': name, 'seconds': seconds, 'pixels': int(pixels), 'peakBytes': int(peakBytes), 'calls': calls})
+
+    def stop(self):
+        # Stop allocation tracing started by this profiler.
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def getReport(self):
+        with self.lock:
+            return {name: dict(stage) for name, stage in sorted(self.stages.items())}
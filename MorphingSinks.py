@@ -0,0 +1,249 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import imageio
+import numpy as np
+from PIL import Image
+
+reverseModes = ('copy', 'hardlink', 'symlink', 'manifest')
+
+def mirrorFrame(framePath, mirrorPath, reverseMode):
+    # Reuse an encoded frame for its mirrored position in the sequence.
+    if os.path.lexists(mirrorPath): os.remove(mirrorPath)
+    if reverseMode == 'hardlink':
+        try:
+            os.link(framePath, mirrorPath)
+        except OSError:
+            shutil.copyfile(framePath, mirrorPath)
+    elif reverseMode == 'symlink':
+        os.symlink(os.path.basename(framePath), mirrorPath)
+    else:
+        shutil.copyfile(framePath, mirrorPath)
+
+def toUint8(frame):
+    # Rescale integer and float frames into the 8-bit range encoders expect.
+    if frame.dtype == 'uint8':
+        return frame
+    if np.issubdtype(frame.dtype, np.integer):
+        return np.round(frame * (255 / np.iinfo(frame.dtype).max)).astype('uint8')
+
+    return np.clip(np.round(frame), 0, 255).astype('uint8')
+
+class FrameSink:
+    def open(self, targetFolderPath, sequenceLength, includeReversed):
+        # Initialize output state.
+        self.targetFolderPath = targetFolderPath
+        self.sequenceLength = sequenceLength
+        self.includeReversed = includeReversed
+
+    def write(self, index, frame):
+        raise NotImplementedError("write must be implemented by frame sinks.")
+
+    def close(self):
+        pass
+
+class ImageSequenceSink(FrameSink):
+    def __init__(self, format = 'jpg', quality = None, mode = None, reverseMode = 'hardlink'):
+        # Validate reverseMode input.
+        if reverseMode not in reverseModes:
+            raise ValueError("reverseMode must be one of " + ', '.join(reverseModes) + ".")
+
+        # Initialize image sequence data.
+        self.format = format
+        self.quality = quality
+        self.mode = mode
+        self.reverseMode = reverseMode
+
+    def getPath(self, number):
+        return self.targetFolderPath + '/frame{:03d}.{}'.format(number, self.format)
+
+    def write(self, index, frame):
+        # Save image, encoding it only once; unlink links left by an earlier run so they are never written through.
+        image = Image.fromarray(toUint8(frame))
+        if self.mode is not None: image = image.convert(self.mode)
+        framePath = self.getPath(index + 1)
+        if os.path.lexists(framePath): os.remove(framePath)
+        if self.quality is not None: image.save(framePath, quality = self.quality)
+        else: image.save(framePath)
+
+        # Fill the mirrored position of the reversed sequence.
+        if self.includeReversed and self.reverseMode != 'manifest':
+            mirrorFrame(framePath, self.getPath(self.sequenceLength * 2 - index), self.reverseMode)
+
+    def close(self):
+        # Describe playback order without duplicate files.
+        if self.reverseMode == 'manifest':
+            names = [os.path.basename(self.getPath(i)) for i in range(1, self.sequenceLength + 1)]
+            if self.includeReversed: names += names[::-1]
+            with open(self.targetFolderPath + '/manifest.txt', 'w') as file:
+                file.writelines([name + '\n' for name in names])
+
+class VideoSink(FrameSink):
+    def __init__(self, fileName = 'morph.mp4', fps = 5, codec = None, **options):
+        # Validate fps input.
+        if fps <= 0:
+            raise ValueError("fps must be positive.")
+
+        # Initialize video data.
+        self.fileName = fileName
+        self.fps = fps
+        self.codec = codec
+        self.options = options
+
+    def open(self, targetFolderPath, sequenceLength, includeReversed):
+        super(VideoSink, self).open(targetFolderPath, sequenceLength, includeReversed)
+
+        # Initialize writer.
+        options = dict(fps = self.fps, macro_block_size = None)
+        if self.codec is not None: options['codec'] = self.codec
+        options.update(self.options)
+        self.writer = imageio.get_writer(targetFolderPath + '/' + self.fileName, **options)
+        self.spill = None
+        self.frames = None
+
+    def write(self, index, frame):
+        # Append forward frame.
+        frame = toUint8(frame)
+        self.writer.append_data(frame)
+
+        # Spill frames to disk for reversed playback instead of keeping them in memory.
+        if self.includeReversed:
+            if self.frames is None:
+                self.spill = tempfile.TemporaryFile(dir = self.targetFolderPath)
+                self.frames = np.memmap(self.spill, dtype = 'uint8', mode = 'w+', shape = (self.sequenceLength,) + frame.shape)
+            self.frames[index] = frame
+
+    def close(self):
+        # Append reversed frames, read back from disk.
+        if self.frames is not None:
+            for i in range(self.sequenceLength - 1, -1, -1):
+                self.writer.append_data(np.array(self.frames[i]))
+            self.frames = None
+            self.spill.close()
+
+        # Finalize video.
+        self.writer.close()
+
+class ArraySink(FrameSink):
+    def __init__(self, fileName = 'frames.npy', dtype = None):
+        # Initialize array data.
+        self.fileName = fileName
+        self.dtype = dtype
+
+    def open(self, targetFolderPath, sequenceLength, includeReversed):
+        super(ArraySink, self).open(targetFolderPath, sequenceLength, includeReversed)
+        self.frames = None
+
+    def write(self, index, frame):
+        # Create memory-mapped stack on first frame.
+        if self.frames is None:
+            count = self.sequenceLength * (2 if self.includeReversed else 1)
+            dtype = self.dtype if self.dtype is not None else frame.dtype
+            self.frames = np.lib.format.open_memmap(self.targetFolderPath + '/' + self.fileName, mode = 'w+', dtype = dtype, shape = (count,) + frame.shape)
+
+        # Store frame at its forward and mirrored positions.
+        self.frames[index] = frame
+        if self.includeReversed:
+            self.frames[self.sequenceLength * 2 - index - 1] = frame
+
+    def close(self):
+        # Flush stack to disk.
+        if self.frames is not None:
+            self.frames.flush()
+            self.frames = None
+
+class FramePipeline:
+    def __init__(self, sinks, queueSize = 8, onProgress = None):
+        # Validate sinks input.
+        for sink in sinks:
+            if not isinstance(sink, FrameSink):
+                raise TypeError("sinks must contain FrameSink instances.")
+
+        # Validate queueSize input.
+        if queueSize < 1:
+            raise ValueError("queueSize must be a positive integer.")
+
+        # Initialize pipeline data.
+        self.sinks = list(sinks)
+        self.queueSize = queueSize
+        self.onProgress = onProgress
+        self.queue = None
+        self.thread = None
+        self.error = None
+
+    def open(self, targetFolderPath, sequenceLength, includeReversed):
+        # Open all sinks.
+        for sink in self.sinks:
+            sink.open(targetFolderPath, sequenceLength, includeReversed)
+
+        # Reset statistics.
+        self.sequenceLength = sequenceLength
+        self.framesQueued = 0
+        self.framesWritten = 0
+        self.maximumDepth = 0
+        self.blockedTime = 0.0
+        self.sinkTimes = [0.0] * len(self.sinks)
+
+        # Start encoder thread.
+        self.queue = queue.Queue(self.queueSize)
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def put(self, index, frame):
+        # Surface encoder failures on the rendering thread.
+        if self.error is not None:
+            raise self.error
+
+        # Queue frame, blocking while the encoder is behind.
+        start = time.perf_counter()
+        self.queue.put((index, frame))
+        self.blockedTime += time.perf_counter() - start
+        self.framesQueued += 1
+        self.maximumDepth = max(self.maximumDepth, self.queue.qsize())
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+
+            # Drain remaining frames after a failure so producers never block.
+            if self.error is not None: continue
+
+            # Write frame to every sink.
+            try:
+                for i, sink in enumerate(self.sinks):
+                    start = time.perf_counter()
+                    sink.write(*item)
+                    self.sinkTimes[i] += time.perf_counter() - start
+            except Exception as error:
+                self.error = error
+                continue
+
+            # Report progress.
+            self.framesWritten += 1
+            if self.onProgress is not None:
+                self.onProgress(self.getStats())
+
+    def close(self):
+        # Wait for queued frames to be written.
+        self.queue.put(None)
+        self.thread.join()
+
+        # Finalize all sinks.
+        for sink in self.sinks:
+            sink.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def getStats(self):
+        return {'sequenceLength': self.sequenceLength,
+                'framesQueued': self.framesQueued,
+                'framesWritten': self.framesWritten,
+                'queueDepth': self.queue.qsize(),
+                'maximumDepth': self.maximumDepth,
+                'blockedTime': self.blockedTime,
+                'sinkTimes': {type(sink).__name__ + str(i): self.sinkTimes[i] for i, sink in enumerate(self.sinks)}}
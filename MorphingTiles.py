@@ -0,0 +1,175 @@
+import json
+import os
+import imageio
+import numpy as np
+from PIL import Image
+
+class TiledImage:
+    def __init__(self, path):
+        # Validate cache folder.
+        infoPath = os.path.join(path, 'image.json')
+        if not os.path.isfile(infoPath):
+            raise ValueError("{} is not a tiled image cache.".format(path))
+
+        # Map tiles lazily; pages are only read when pixels are sampled.
+        with open(infoPath) as file:
+            info = json.load(file)
+        self.path = path
+        self.shape = tuple(info['shape'])
+        self.tileSize = info['tileSize']
+        self.tiles = np.load(os.path.join(path, 'tiles.npy'), mmap_mode = 'r')
+        self.dtype = self.tiles.dtype
+        self.ndim = len(self.shape)
+        self.nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __reduce__(self):
+        # Pass tiled images to worker processes by path instead of by value.
+        return (TiledImage, (self.path,))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype = None, copy = None):
+        # Decode the whole image; only for explicit conversions.
+        image = self.getRegion(0, self.shape[0], 0, self.shape[1])
+
+        return image if dtype is None else image.astype(dtype)
+
+    def __getitem__(self, key):
+        # Validate key input.
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise TypeError("tiled images are indexed by rows and columns.")
+        rows, cols = key
+
+        # Copy out a rectangular region.
+        if isinstance(rows, slice) and isinstance(cols, slice):
+            if rows.step not in (None, 1) or cols.step not in (None, 1):
+                raise ValueError("tiled image slices must be contiguous.")
+            top, bottom, _ = rows.indices(self.shape[0])
+            left, right, _ = cols.indices(self.shape[1])
+            return self.getRegion(top, bottom, left, right)
+
+        # Gather individual pixels from the tiles they fall in.
+        rows = np.asarray(rows, dtype = 'intp')
+        cols = np.asarray(cols, dtype = 'intp')
+        return self.tiles[rows // self.tileSize, cols // self.tileSize, rows % self.tileSize, cols % self.tileSize]
+
+    def getRegion(self, top, bottom, left, right):
+        # Assemble region from every tile it overlaps.
+        region = np.empty((max(bottom - top, 0), max(right - left, 0)) + self.shape[2:], dtype = self.dtype)
+        size = self.tileSize
+        for tileRow in range(top // size, (bottom - 1) // size + 1 if bottom > top else 0):
+            rowStart, rowStop = max(top, tileRow * size), min(bottom, (tileRow + 1) * size)
+            for tileCol in range(left // size, (right - 1) // size + 1 if right > left else 0):
+                colStart, colStop = max(left, tileCol * size), min(right, (tileCol + 1) * size)
+                region[rowStart - top:rowStop - top, colStart - left:colStop - left] = \
+                    self.tiles[tileRow, tileCol, rowStart - tileRow * size:rowStop - tileRow * size, colStart - tileCol * size:colStop - tileCol * size]
+
+        return region
+
+def getRawStrips(imagePath, source):
+    # Map uncompressed 8-bit strips straight from the file; compressed or unusual layouts return None.
+    width, height = source.size
+    channels = {'L': 1, 'RGB': 3, 'RGBA': 4}.get(source.mode)
+    if channels is None or not source.tile: return None
+    strips = []
+    for tile in source.tile:
+        name, (left, top, right, bottom), offset, args = tuple(tile)[:4]
+        rawmode, stride, orientation = (((args,) if isinstance(args, str) else tuple(args)) + (0, 1))[:3]
+        if name != 'raw' or left != 0 or right != width or rawmode not in (source.mode, 'BGR' if source.mode == 'RGB' else None) or orientation not in (1, -1):
+            return None
+
+        # View the strip's rows, dropping row padding and restoring channel and row order.
+        stride = stride or width * channels
+        rows = np.memmap(imagePath, dtype = 'uint8', mode = 'r', offset = offset, shape = (bottom - top, stride))[:, :width * channels]
+        rows = rows.reshape((bottom - top, width) + ((channels,) if channels > 1 else ()))
+        if rawmode == 'BGR': rows = rows[..., ::-1]
+        if orientation == -1: rows = rows[::-1]
+        strips.append((top, bottom, rows))
+
+    # Require strips that cover every row once, in order.
+    if [strip[0] for strip in strips] != [0] + [strip[1] for strip in strips[:-1]] or strips[-1][1] != height:
+        return None
+
+    return strips
+
+def readStrips(strips, top, bottom):
+    # Copy the rows of a band from every strip it overlaps.
+    return np.concatenate([rows[max(top, start) - start:min(bottom, stop) - start] for start, stop, rows in strips if start < bottom and stop > top])
+
+def getTilePath(imagePath):
+    return imagePath + '.tiles'
+
+def convertToTiles(imagePath, cachePath = None, tileSize = 256):
+    # Validate tileSize input.
+    if tileSize < 1:
+        raise ValueError("tileSize must be a positive integer.")
+    if cachePath is None: cachePath = getTilePath(imagePath)
+
+    # Reuse a cache built from the same file with the same tile size.
+    infoPath = os.path.join(cachePath, 'image.json')
+    if os.path.isfile(infoPath) and os.path.getmtime(infoPath) >= os.path.getmtime(imagePath):
+        with open(infoPath) as file:
+            if json.load(file).get('tileSize') == tileSize:
+                return TiledImage(cachePath)
+
+    # Open source lazily: .npy files and uncompressed strips are memory-mapped, other formats are decoded whole by PIL.
+    if imagePath.endswith('.npy'):
+        source = np.load(imagePath, mmap_mode = 'r')
+        shape, dtype = source.shape, source.dtype
+        readBand = lambda top, bottom: source[top:bottom]
+    else:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            source = Image.open(imagePath)
+            strips = getRawStrips(imagePath, source)
+            if strips is None: source.load()
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+        if strips is not None:
+            shape, dtype = (source.size[1], source.size[0]) + strips[0][2].shape[2:], strips[0][2].dtype
+            readBand = lambda top, bottom: readStrips(strips, top, bottom)
+        else:
+            if source.mode not in ('L', 'RGB', 'RGBA', 'I;16'): source = source.convert('L' if source.mode in ('1', 'I', 'F') else 'RGB')
+            shape = (source.size[1], source.size[0]) + ((len(source.getbands()),) if len(source.getbands()) > 1 else ())
+            dtype = np.asarray(source.crop((0, 0, 1, 1))).dtype
+            readBand = lambda top, bottom: np.asarray(source.crop((0, top, shape[1], bottom)))
+
+    # Copy one row of tiles at a time into a padded tile grid.
+    if not os.path.exists(cachePath): os.makedirs(cachePath)
+    if os.path.isfile(infoPath): os.remove(infoPath)
+    grid = (-(-shape[0] // tileSize), -(-shape[1] // tileSize))
+    tiles = np.lib.format.open_memmap(os.path.join(cachePath, 'tiles.npy'), mode = 'w+', dtype = dtype, shape = grid + (tileSize, tileSize) + tuple(shape[2:]))
+    for tileRow in range(grid[0]):
+        band = readBand(tileRow * tileSize, min((tileRow + 1) * tileSize, shape[0]))
+        for tileCol in range(grid[1]):
+            block = band[:, tileCol * tileSize:(tileCol + 1) * tileSize]
+            tiles[tileRow, tileCol, :block.shape[0], :block.shape[1]] = block
+    tiles.flush()
+    del tiles
+
+    # Record image shape last, marking the cache as complete.
+    with open(infoPath, 'w') as file:
+        json.dump({'shape': list(shape), 'tileSize': tileSize, 'source': os.path.abspath(imagePath)}, file)
+
+    return TiledImage(cachePath)
+
+def openImage(imagePath, maximumPixels = 64 * 2 ** 20, tileSize = 256):
+    # Decode small images in memory and page large ones in from a tiled cache.
+    if imagePath.endswith('.npy'):
+        return np.load(imagePath, mmap_mode = 'r')
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        with Image.open(imagePath) as image:
+            width, height = image.size
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+    if width * height <= maximumPixels:
+        return imageio.imread(imagePath)
+
+    return convertToTiles(imagePath, tileSize = tileSize)
+
+def isImage(image):
+    return isinstance(image, (np.ndarray, TiledImage))
@@ -0,0 +1,100 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Morphing
+from Morphing import *
+from MorphingPoints import *
+from MorphingTiles import openImage
+
+folder = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture(scope = 'module')
+def pair():
+    # Load the bundled tiger and wolf images with their correspondences.
+    images = [openImage(os.path.join(folder, name)) for name in ('tiger.jpg', 'wolf.jpg')]
+    points = [loadPoints(os.path.join(folder, name), convert = False) for name in ('tiger.jpg', 'wolf.jpg')]
+
+    return images[0], points[0], images[1], points[1]
+
+def test_threads_and_tiles_match_single_thread(pair):
+    expected = Blender(*pair).getBlendedImage(0.37)
+    assert np.array_equal(Blender(*pair).getBlendedImage(0.37, threads = 4, tiles = 7), expected)
+
+def test_bands_match_full_frame(pair, monkeypatch):
+    expected = Blender(*pair).getBlendedImage(0.61)
+    monkeypatch.setattr(Morphing, 'bandBudget', 2 ** 20)
+    blender = Blender(*pair)
+    assert blender.getBandHeight() < pair[0].shape[0]
+    assert np.array_equal(blender.getBlendedImage(0.61), expected)
+    assert np.array_equal(blender.getBlendedImage(0.61, threads = 3), expected)
+
+def test_process_pool_matches_single_process(pair):
+    blender = Blender(*pair)
+    alphas = [0.1, 0.5, 0.9]
+    for frame, expected in zip(renderFrames(blender, alphas, workers = 2), renderFrames(blender, alphas)):
+        assert np.array_equal(frame, expected)
+
+def test_blended_images_match_frames(pair):
+    blender = Blender(*pair)
+    alphas = [0.0, 0.25, 0.5, 1.0]
+    frames = blender.getBlendedImages(alphas, chunkSize = 3)
+    for frame, alpha in zip(frames, alphas):
+        assert np.array_equal(frame, Blender(*pair).getBlendedImage(alpha))
+
+def test_point_edits_match_full_render(pair):
+    startImage, startPoints, endImage, endPoints = pair
+    blender = Blender(*pair)
+    blender.getCachedImage(0.5)
+
+    # Add, move and delete points, comparing cached frames against fresh blenders each time.
+    blender.addPoint([400.5, 300.5], [410.0, 290.0])
+    startPoints = np.vstack((startPoints, [400.5, 300.5]))
+    endPoints = np.vstack((endPoints, [410.0, 290.0]))
+    assert np.array_equal(blender.getCachedImage(0.5), Blender(startImage, startPoints, endImage, endPoints).getBlendedImage(0.5))
+
+    blender.movePoint(10, startPoints[10] + 3, endPoints[10] - 2)
+    startPoints[10] += 3
+    endPoints[10] -= 2
+    assert np.array_equal(blender.getCachedImage(0.5), Blender(startImage, startPoints, endImage, endPoints).getBlendedImage(0.5))
+
+    blender.deletePoint(20)
+    startPoints = np.delete(startPoints, 20, axis = 0)
+    endPoints = np.delete(endPoints, 20, axis = 0)
+    assert np.array_equal(blender.getCachedImage(0.5), Blender(startImage, startPoints, endImage, endPoints).getBlendedImage(0.5))
+
+def test_point_file_round_trip(pair, tmp_path):
+    path = str(tmp_path / 'points.pts')
+    pointFile = PointFile.create(path, pair[1])
+    pointFile.append([1.25, 2.5])
+    points = PointFile(path).load()
+    assert PointFile(path).getCount() == pair[1].shape[0] + 1
+    assert np.allclose(points[:-1], pair[1], atol = 1e-3)
+    assert np.array_equal(points[-1], [1.25, 2.5])
+
+def test_point_file_checksum(pair, tmp_path):
+    path = str(tmp_path / 'points.pts')
+    PointFile.create(path, pair[1])
+    with open(path, 'r+b') as file:
+        file.seek(-1, os.SEEK_END)
+        last = file.read(1)
+        file.seek(-1, os.SEEK_END)
+        file.write(bytes([last[0] ^ 0xff]))
+    with pytest.raises(ValueError, match = 'checksum'):
+        PointFile(path).load()
+    assert PointFile(path).load(validate = False).shape == pair[1].shape
+
+def test_frame_cache_hits(pair, tmp_path):
+    cache = FrameCache(memoryBudget = 0, diskBudget = 64 * 2 ** 20, diskPath = str(tmp_path))
+    expected = Blender(*pair, cache = cache).getBlendedImage(0.3)
+    assert cache.getStats()['misses'] == 1
+
+    # A second cache over the same folder reads the frame back from disk.
+    cache = FrameCache(memoryBudget = 64 * 2 ** 20, diskBudget = 64 * 2 ** 20, diskPath = str(tmp_path))
+    blender = Blender(*pair, cache = cache)
+    assert np.array_equal(blender.getBlendedImage(0.3), expected)
+    assert np.array_equal(blender.getBlendedImage(0.3), expected)
+    assert cache.getStats()['diskHits'] == 1
+    assert cache.getStats()['hits'] == 1